@@ -2,6 +2,7 @@ from setuptools import setup
 
 requires = [
         'Cython',
+        'numba',
         'numpy >= 1.13',
         'scipy',
         'sparse',
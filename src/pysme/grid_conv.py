@@ -7,11 +7,33 @@
 """
 
 import numpy as np
+from numba import cuda, njit, prange
+from scipy.linalg.blas import dasum
+import pysme.integrate as integ
+import pysme.system_builder as sb
+
+INV_SQRT2 = 1/np.sqrt(2)
+INV_2SQRT2 = 1/(2*np.sqrt(2))
+SQRT3 = np.sqrt(3)
 
 def l1_norm(vec):
-    return np.sum(np.abs(vec))
+    return dasum(np.ascontiguousarray(vec).ravel())
+
+@njit(cache=True)
+def l1_norms(vecs):
+    """Return the l1 norm of each row of a 2-D array.
+
+    Like ``l1_norm``, accumulates the absolute values directly rather than
+    allocating the full-size temporary ``np.abs(vecs)``.
 
-def double_increments(times, U1s, U2s=None):
+    """
+    norms = np.zeros(vecs.shape[0])
+    for n in range(vecs.shape[0]):
+        for j in range(vecs.shape[1]):
+            norms[n] += abs(vecs[n,j])
+    return norms
+
+def double_increments(times, U1s, U2s=None, out=None):
     r"""Construct longer time and Wiener increments from shorter increments.
     
     Take a list of times (assumed to be evenly spaced) and standard-normal
@@ -39,33 +61,92 @@ def double_increments(times, U1s, U2s=None):
         Samples from a standard-normal distribution used to construct
         multiple-Ito increments :math:`\Delta Z` for each time interval.
         Multiple rows may be included for independent trajectories.
+    out : tuple of numpy.array, optional
+        Preallocated arrays ``(new_U1s, new_U2s)`` of shape
+        ``U1s[...,::2].shape`` to write the results into (``new_U2s`` may be
+        ``None`` if `U2s` is ``None``). Must not overlap `U1s` or `U2s`.
 
     Returns
     -------
     times: numpy.array(len(times)//2 + 1)
         Times sampled at half the frequency.
-    U1s : numpy.array(len(times)//2)
+    U1s : numpy.array(N, len(times)//2)
         Standard-normal-random-variable samples for the longer intervals.
-    U2s : numpy.array(len(times)//2), optional
+    U2s : numpy.array(N, len(times)//2), optional
         Standard-normal-random-variable samples for the longer intervals (not
         returned if `U2s` is ``None``.
 
     """
 
     new_times = times[::2]
-    even_U1s = U1s[::2]
-    odd_U1s = U1s[1::2]
-    new_U1s = (even_U1s + odd_U1s)/np.sqrt(2)
+    even_U1s = U1s[...,::2]
+    odd_U1s = U1s[...,1::2]
+    if out is None:
+        new_U1s = np.empty(even_U1s.shape)
+        new_U2s = None if U2s is None else np.empty(even_U1s.shape)
+    else:
+        new_U1s, new_U2s = out
+
+    np.add(even_U1s, odd_U1s, out=new_U1s)
+    new_U1s *= INV_SQRT2
 
     if U2s is None:
         return new_times, new_U1s
     else:
-        even_U2s = U2s[::2]
-        odd_U2s = U2s[1::2]
-        new_U2s = (np.sqrt(3)*(even_U1s - odd_U1s) +
-                   even_U2s + odd_U2s)/(2*np.sqrt(2))
+        np.subtract(even_U1s, odd_U1s, out=new_U2s)
+        new_U2s *= SQRT3
+        new_U2s += U2s[...,::2]
+        new_U2s += U2s[...,1::2]
+        new_U2s *= INV_2SQRT2
         return new_times, new_U1s, new_U2s
 
+def quadruple_increments(times, U1s, U2s):
+    r"""Construct doubled and quadrupled increments in a single pass.
+
+    Equivalent to applying ``double_increments`` twice, but the pairwise sums
+    of `U1s` are reused for both coarser grids rather than rebuilding them from
+    the rescaled doubled samples.
+
+    Parameters
+    ----------
+    times : numpy.array
+        List of evenly spaced times defining a number of time intervals
+        divisible by 4.
+    U1s : numpy.array(N, len(times) - 1)
+        Samples from a standard-normal distribution used to construct Wiener
+        increments :math:`\Delta W` for each time interval. Multiple rows may
+        be included for independent trajectories.
+    U2s : numpy.array(N, len(times) - 1)
+        Samples from a standard-normal distribution used to construct
+        multiple-Ito increments :math:`\Delta Z` for each time interval.
+        Multiple rows may be included for independent trajectories.
+
+    Returns
+    -------
+    tuple of numpy.array
+        ``(times_2, U1s_2, U2s_2, times_4, U1s_4, U2s_4)``, the times and
+        standard-normal-random-variable samples for the doubled and quadrupled
+        intervals.
+
+    """
+    pair_sums = U1s[...,::2] + U1s[...,1::2]
+    U1s_2 = pair_sums*INV_SQRT2
+    U2s_2 = U1s[...,::2] - U1s[...,1::2]
+    U2s_2 *= SQRT3
+    U2s_2 += U2s[...,::2]
+    U2s_2 += U2s[...,1::2]
+    U2s_2 *= INV_2SQRT2
+
+    U1s_4 = pair_sums[...,::2] + pair_sums[...,1::2]
+    U2s_4 = pair_sums[...,::2] - pair_sums[...,1::2]
+    U1s_4 *= 0.5
+    U2s_4 *= SQRT3*INV_SQRT2
+    U2s_4 += U2s_2[...,::2]
+    U2s_4 += U2s_2[...,1::2]
+    U2s_4 *= INV_2SQRT2
+
+    return times[::2], U1s_2, U2s_2, times[::4], U1s_4, U2s_4
+
 def calc_rate(integrator, rho_0, times, U1s=None, U2s=None):
     """Calculate the convergence rate for some integrator.
 
@@ -81,7 +162,8 @@ def calc_rate(integrator, rho_0, times, U1s=None, U2s=None):
     U1s : numpy.array(len(times) - 1), optional
         Samples from a standard-normal distribution used to construct Wiener
         increments :math:`\Delta W` for each time interval. If not provided
-        will be generated by the function.
+        will be generated by the function. Multiple rows may be included for
+        independent trajectories, which are integrated as a batch.
     U2s : numpy.array(len(times) - 1), optional
         Samples from a standard-normal distribution used to construct
         multiple-Ito increments :math:`\Delta Z` for each time interval. If not
@@ -89,25 +171,224 @@ def calc_rate(integrator, rho_0, times, U1s=None, U2s=None):
 
     Returns
     -------
-    float
-        The convergence rate as a power of :math:`\Delta t`.
+    float or numpy.array
+        The convergence rate as a power of :math:`\Delta t` (for each
+        trajectory if `U1s` has multiple rows).
 
     """
     increments = len(times) - 1
     if U1s is None:
         U1s = np.random.randn(increments)
     if U2s is None:
-        U2s = np.random.randn(increments)
+        U2s = np.random.randn(*np.shape(U1s))
+    U1s = np.asarray(U1s)
+    norm = l1_norm if U1s.ndim == 1 else l1_norms
 
     # Calculate times and random variables for the double and quadruple
     # intervals
-    times_2, U1s_2, U2s_2 = double_increments(times, U1s, U2s)
-    times_4, U1s_4, U2s_4 = double_increments(times_2, U1s_2, U2s_2)
+    times_2, U1s_2, U2s_2, times_4, U1s_4, U2s_4 = quadruple_increments(
+            times, U1s, U2s)
 
-    rhos = integrator.integrate(rho_0, times, U1s, U2s).vec_soln
-    rhos_2 = integrator.integrate(rho_0, times_2, U1s_2, U2s_2).vec_soln
-    rhos_4 = integrator.integrate(rho_0, times_4, U1s_4, U2s_4).vec_soln
-    rate = (np.log(l1_norm(rhos_4[-1] - rhos_2[-1])) -
-            np.log(l1_norm(rhos_2[-1] - rhos[-1])))/np.log(2)
+    # Some integrators (such as the faulty Milstein) return lists of states
+    rhos = np.asarray(integrator.integrate(rho_0, times, U1s, U2s).vec_soln)
+    rhos_2 = np.asarray(integrator.integrate(rho_0, times_2, U1s_2,
+                                             U2s_2).vec_soln)
+    rhos_4 = np.asarray(integrator.integrate(rho_0, times_4, U1s_4,
+                                             U2s_4).vec_soln)
+    rate = (np.log(norm(rhos_4[...,-1,:] - rhos_2[...,-1,:])) -
+            np.log(norm(rhos_2[...,-1,:] - rhos[...,-1,:])))/np.log(2)
 
     return rate
+
+def calc_error(integrator, rho_0, times, U1s=None, U2s=None):
+    r"""Estimate the strong error of an integrator by Richardson extrapolation.
+
+    Assuming the error of the final state on a grid with step size
+    :math:`\Delta t` behaves as :math:`C\Delta t^p` for the integrator's
+    ``strong_order`` :math:`p`, the error on the fine grid is estimated from
+    the difference with the doubled grid alone:
+
+    .. math::
+
+       \|\vec{\rho}_{\Delta t}-\vec{\rho}\|_1\approx
+       \frac{\|\vec{\rho}_{\Delta t}-\vec{\rho}_{2\Delta t}\|_1}{2^p-1}
+
+    This needs two integrations rather than the three used by ``calc_rate``,
+    but trusts rather than measures the order, so ``calc_rate`` should be used
+    to verify an integrator.
+
+    Parameters
+    ----------
+    integrator :
+        An Integrator object with a ``strong_order`` attribute.
+    rho_0 : numpy.array
+        The initial state of the system
+    times : numpy.array
+        Sequence of times (assumed to be evenly spaced, defining an even
+        number of increments).
+    U1s : numpy.array(len(times) - 1), optional
+        Samples from a standard-normal distribution used to construct Wiener
+        increments :math:`\Delta W` for each time interval. If not provided
+        will be generated by the function. Multiple rows may be included for
+        independent trajectories, which are integrated as a batch.
+    U2s : numpy.array(len(times) - 1), optional
+        Samples from a standard-normal distribution used to construct
+        multiple-Ito increments :math:`\Delta Z` for each time interval. If not
+        provided will be generated by the function.
+
+    Returns
+    -------
+    float or numpy.array
+        The estimated :math:`\ell_1` error of the final state on the fine grid
+        (for each trajectory if `U1s` has multiple rows).
+
+    """
+    increments = len(times) - 1
+    if U1s is None:
+        U1s = np.random.randn(increments)
+    if U2s is None:
+        U2s = np.random.randn(*np.shape(U1s))
+    U1s = np.asarray(U1s)
+    norm = l1_norm if U1s.ndim == 1 else l1_norms
+
+    times_2, U1s_2, U2s_2 = double_increments(times, U1s, U2s)
+
+    rhos = np.asarray(integrator.integrate(rho_0, times, U1s, U2s).vec_soln)
+    rhos_2 = np.asarray(integrator.integrate(rho_0, times_2, U1s_2,
+                                             U2s_2).vec_soln)
+    return (norm(rhos_2[...,-1,:] - rhos[...,-1,:]) /
+            (2**integrator.strong_order - 1))
+
+@njit(parallel=True)
+def grid_final_states(kernel, ops, ops_2, ops_4, rho_0, dts, U1s_arr, U2s_arr,
+                      U1s_2_arr, U2s_2_arr, U1s_4_arr, U2s_4_arr):
+    """Integrate a batch of trajectories on three grids in parallel.
+
+    Each thread integrates one trajectory on the fine, doubled, and quadrupled
+    grids (with the step sizes in `dts`) using a compiled integration kernel
+    such as ``integrate.taylor_1_5_homodyne``, keeping only the final states.
+    The kernel takes the step size at run time, so this function is only
+    compiled once for each kernel and dtype.
+
+    Returns
+    -------
+    numpy.array(3, len(U1s_arr), len(rho_0))
+        The final states on the fine, doubled, and quadrupled grids for each
+        trajectory.
+
+    """
+    trajectories = U1s_arr.shape[0]
+    final_rhos = np.empty((3, trajectories, rho_0.shape[0]), rho_0.dtype)
+    for n in prange(trajectories):
+        final_rhos[0,n] = kernel(ops, rho_0, dts[0], U1s_arr[n],
+                                 U2s_arr[n])[-1]
+        final_rhos[1,n] = kernel(ops_2, rho_0, dts[1], U1s_2_arr[n],
+                                 U2s_2_arr[n])[-1]
+        final_rhos[2,n] = kernel(ops_4, rho_0, dts[2], U1s_4_arr[n],
+                                 U2s_4_arr[n])[-1]
+    return final_rhos
+
+def cuda_final_states(kernel, ops, rho_0, dt, U1s_arr, U2s_arr,
+                      threads_per_block=64):
+    """Integrate a batch of trajectories on a CUDA device.
+
+    Launches one thread per trajectory, keeping only the final states. The
+    step size and noise are converted to the dtype of `rho_0` so the device
+    does all its arithmetic in that precision.
+
+    Returns
+    -------
+    numpy.array(len(U1s_arr), len(rho_0))
+        The final state of each trajectory.
+
+    """
+    trajectories = U1s_arr.shape[0]
+    final_rhos = cuda.device_array((trajectories, rho_0.shape[0]),
+                                   dtype=rho_0.dtype)
+    blocks = (trajectories + threads_per_block - 1)//threads_per_block
+    dtype = rho_0.dtype
+    kernel[blocks, threads_per_block](
+            cuda.to_device(ops), cuda.to_device(rho_0), dtype.type(dt),
+            cuda.to_device(np.ascontiguousarray(U1s_arr, dtype=dtype)),
+            cuda.to_device(np.ascontiguousarray(U2s_arr, dtype=dtype)),
+            final_rhos)
+    return final_rhos.copy_to_host()
+
+def calc_rates(integrator, rho_0, times, U1s_arr, U2s_arr, target='cpu'):
+    r"""Calculate the convergence rates for a batch of trajectories.
+
+    Equivalent to calling ``calc_rate`` for each row of `U1s_arr` and
+    `U2s_arr`, but for integrators with a compiled ``kernel`` the trajectories
+    are integrated in parallel threads.
+
+    Parameters
+    ----------
+    integrator :
+        An Integrator object.
+    rho_0 : numpy.array
+        The initial state of the system
+    times : numpy.array
+        Sequence of times (assumed to be evenly spaced, defining a number of
+        increments divisible by 4).
+    U1s_arr : numpy.array(trajectories, len(times) - 1)
+        Samples from a standard-normal distribution used to construct Wiener
+        increments :math:`\Delta W` for each trajectory and time interval.
+    U2s_arr : numpy.array(trajectories, len(times) - 1)
+        Samples from a standard-normal distribution used to construct
+        multiple-Ito increments :math:`\Delta Z` for each trajectory and time
+        interval.
+    target : str, optional
+        ``'cpu'`` (default) to integrate the trajectories in parallel threads,
+        or ``'cuda'`` to integrate them on a CUDA device with one thread per
+        trajectory.
+
+    Returns
+    -------
+    numpy.array(trajectories)
+        The convergence rate of each trajectory as a power of :math:`\Delta t`.
+
+    """
+    if target not in ('cpu', 'cuda'):
+        raise ValueError("target must be 'cpu' or 'cuda', not {!r}".format(
+                target))
+    kernel = getattr(integrator, 'kernel', None)
+    if kernel is None:
+        return np.array([calc_rate(integrator, rho_0, times, U1s, U2s)
+                         for U1s, U2s in zip(U1s_arr, U2s_arr)])
+
+    dt = (times[-1] - times[0])/(len(times) - 1)
+    _, U1s_2_arr, U2s_2_arr, _, U1s_4_arr, U2s_4_arr = quadruple_increments(
+            times, U1s_arr, U2s_arr)
+    # Hand the kernels everything in the integrator's dtype so single-precision
+    # integrators do all their arithmetic in single precision
+    dtype = integrator.dtype
+    rho_0_vec = np.ascontiguousarray(sb.vectorize(rho_0, integrator.basis).real,
+                                     dtype=dtype)
+    U1s_arr, U2s_arr, U1s_2_arr, U2s_2_arr, U1s_4_arr, U2s_4_arr = [
+            np.ascontiguousarray(U, dtype=dtype)
+            for U in [U1s_arr, U2s_arr, U1s_2_arr, U2s_2_arr, U1s_4_arr,
+                      U2s_4_arr]]
+    if target == 'cuda':
+        device_kernel = integ.cuda_kernel(kernel, rho_0_vec.shape[0],
+                                          integrator.dtype)
+        rhos, rhos_2, rhos_4 = [
+                cuda_final_states(device_kernel, integrator.prepare_step(step),
+                                  rho_0_vec, step, U1s, U2s)
+                for step, U1s, U2s in [(dt, U1s_arr, U2s_arr),
+                                       (2*dt, U1s_2_arr, U2s_2_arr),
+                                       (4*dt, U1s_4_arr, U2s_4_arr)]]
+        return (np.log(l1_norms(rhos_4 - rhos_2)) -
+                np.log(l1_norms(rhos_2 - rhos)))/np.log(2)
+
+    rhos, rhos_2, rhos_4 = grid_final_states(integrator.step_kernel(),
+                                             integrator.prepare(dt),
+                                             integrator.prepare(2*dt),
+                                             integrator.prepare(4*dt),
+                                             rho_0_vec,
+                                             np.array([dt, 2*dt, 4*dt], dtype),
+                                             U1s_arr, U2s_arr, U1s_2_arr,
+                                             U2s_2_arr, U1s_4_arr, U2s_4_arr)
+    rates = (np.log(l1_norms(rhos_4 - rhos_2)) -
+             np.log(l1_norms(rhos_2 - rhos)))/np.log(2)
+
+    return rates
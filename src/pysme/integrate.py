@@ -6,8 +6,17 @@
 
 """
 
+from collections import namedtuple, OrderedDict
+import math
 import numpy as np
-from scipy.integrate import odeint, solve_ivp
+import numba
+from numba import cuda, njit
+from numba.extending import overload
+from numba.np.numpy_support import as_dtype
+from scipy.integrate import solve_ivp
+from scipy.linalg import expm
+from scipy.linalg.blas import dgemv
+from scipy.sparse.linalg import expm_multiply
 import pysme.system_builder as sb
 import pysme.sde as sde
 import pysme.gellmann as gm
@@ -185,6 +194,1013 @@ def b_b_dx_dx_b(G, k_T, k_T_G, rho):
     k_T_G_rho_dot = np.dot(k_T_G, rho)
     return 2*(k_T_G_rho_dot + k_rho_dot**2)*(np.dot(G, rho) + k_rho_dot*rho)
 
+IntegratorArrays = namedtuple('IntegratorArrays',
+                              ['Q', 'G', 'G2', 'G3', 'Q2', 'QG', 'GQ', 'k_T',
+                               'k_T_G', 'k_T_G2', 'k_T_Q'])
+IntegratorArrays.__doc__ = r"""Constant arrays defining a homodyne integrator.
+
+Bundles the drift matrix :math:`Q`, the diffusion matrix :math:`G` and dual
+vector :math:`\vec{k}^T`, and the products of them needed by higher-order
+integrators, so they can be handed to compiled code as a single argument.
+Products not needed by an integrator's order are ``None``.
+
+"""
+
+def cast_arrays(arrays, dtype):
+    r"""Cast the arrays bundled in an ``IntegratorArrays`` to a common dtype.
+
+    Parameters
+    ----------
+    arrays: IntegratorArrays
+        The constant arrays of an integrator.
+    dtype: numpy.dtype
+        The floating-point type the compiled integration kernels should work
+        in.
+
+    Returns
+    -------
+    IntegratorArrays
+        The arrays cast to `dtype`, with ``None`` fields left as they are.
+
+    """
+    return IntegratorArrays(*[None if array is None else
+                              np.asarray(array, dtype=dtype)
+                              for array in arrays])
+
+def stack_ops(duals, mats):
+    r"""Stack constant dual vectors and matrices into a single operator.
+
+    Multiplying :math:`\vec{\rho}` by the stacked operator computes all the
+    dot products with the dual vectors (in the first ``len(duals)`` entries)
+    and all the matrix-vector products (in consecutive blocks of
+    ``len(rho)`` entries) with a single matrix-vector multiplication.
+
+    Parameters
+    ----------
+    duals: list of numpy.array
+        Dual vectors, such as :math:`\vec{k}^T` and :math:`\vec{k}^TG`.
+    mats: list of numpy.array
+        Square matrices, such as :math:`Q` and :math:`G`.
+
+    Returns
+    -------
+    numpy.array
+        The operator of shape ``(len(duals) + len(mats)*dim, dim)``.
+
+    """
+    return np.ascontiguousarray(np.vstack(list(duals) + list(mats)))
+
+def step_size(times):
+    r"""Return the step size of evenly spaced times.
+
+    Parameters
+    ----------
+    times: numpy.array
+        A sequence of time points.
+
+    Returns
+    -------
+    float or None
+        The common step size, or ``None`` if `times` are not evenly spaced or
+        there are fewer than two of them.
+
+    """
+    if len(times) < 2:
+        return None
+    dt = (times[-1] - times[0])/(len(times) - 1)
+    if np.allclose(np.diff(times), dt, rtol=1e-8, atol=0):
+        return dt
+    return None
+
+def make_milstein_coeffs(dtype):
+    r"""Build the function computing the coefficients of a Milstein step.
+
+    The returned plain function is the single definition of the scalar
+    coefficients of the homodyne Milstein step, compiled for the CPU kernels
+    through ``milstein_coeffs`` and for the CUDA kernels by
+    ``make_milstein_homodyne_cuda``. Its numerical constants have type
+    `dtype`, so single-precision arguments are not promoted to double
+    precision.
+
+    Parameters
+    ----------
+    dtype: numpy.dtype
+        The floating-point type of the constants.
+
+    Returns
+    -------
+    function
+        The coefficient function.
+
+    """
+    two = np.dtype(dtype).type(2)
+
+    def milstein_coeffs(dW, dt, k_rho, k_G_rho, coeffs):
+        r"""Coefficients of a Milstein step of the homodyne SME.
+
+        The Milstein step is :math:`M_0\vec{\rho}+a\vec{\rho}+b_1G\vec{\rho}+
+        b_2G^2\vec{\rho}`.
+
+        Parameters
+        ----------
+        dW: float
+            The Wiener increment :math:`\Delta W`.
+        dt: float
+            The step size.
+        k_rho: float
+            :math:`\vec{k}^T\vec{\rho}`.
+        k_G_rho: float
+            :math:`\vec{k}^TG\vec{\rho}`.
+        coeffs: numpy.array(2)
+            Array the coefficients :math:`b_1` and :math:`b_2` of
+            :math:`G\vec{\rho}` and :math:`G^2\vec{\rho}` are written into.
+
+        Returns
+        -------
+        float
+            The coefficient :math:`a` of :math:`\vec{\rho}`.
+
+        """
+        c1 = (dW**2 - dt)/two
+        coeffs[0] = dW + two*k_rho*c1
+        coeffs[1] = dW**2/two
+        return k_rho*dW + (k_G_rho + two*k_rho**2)*c1
+
+    return milstein_coeffs
+
+def make_taylor_1_5_coeffs(dtype):
+    r"""Build the function computing the coefficients of a Taylor 1.5 step.
+
+    The returned plain function is the single definition of the scalar
+    coefficients of the homodyne order 1.5 Taylor step, compiled for the CPU
+    kernels through ``taylor_1_5_coeffs`` and for the CUDA kernels by
+    ``make_taylor_1_5_homodyne_cuda``. Its numerical constants have type
+    `dtype`, so single-precision arguments are not promoted to double
+    precision.
+
+    Parameters
+    ----------
+    dtype: numpy.dtype
+        The floating-point type of the constants.
+
+    Returns
+    -------
+    function
+        The coefficient function.
+
+    """
+    two, three, six = np.array([2, 3, 6], dtype=dtype)
+
+    def taylor_1_5_coeffs(dW, dZ, dt, k_rho, k_G_rho, k_G2_rho, k_Q_rho,
+                          coeffs):
+        r"""Coefficients of an order 1.5 Taylor step of the homodyne SME.
+
+        The Taylor step is :math:`M_0\vec{\rho}+a\vec{\rho}` plus a linear
+        combination of :math:`Q\vec{\rho}`, :math:`G\vec{\rho}`,
+        :math:`G^2\vec{\rho}`, :math:`G^3\vec{\rho}`, :math:`QG\vec{\rho}`,
+        and :math:`GQ\vec{\rho}`.
+
+        Parameters
+        ----------
+        dW: float
+            The Wiener increment :math:`\Delta W`.
+        dZ: float
+            The multiple-Ito increment :math:`\Delta Z`.
+        dt: float
+            The step size.
+        k_rho: float
+            :math:`\vec{k}^T\vec{\rho}`.
+        k_G_rho: float
+            :math:`\vec{k}^TG\vec{\rho}`.
+        k_G2_rho: float
+            :math:`\vec{k}^TG^2\vec{\rho}`.
+        k_Q_rho: float
+            :math:`\vec{k}^TQ\vec{\rho}`.
+        coeffs: numpy.array(6)
+            Array the coefficients of :math:`Q\vec{\rho}`,
+            :math:`G\vec{\rho}`, :math:`G^2\vec{\rho}`, :math:`G^3\vec{\rho}`,
+            :math:`QG\vec{\rho}`, and :math:`GQ\vec{\rho}` are written into.
+
+        Returns
+        -------
+        float
+            The coefficient :math:`a` of :math:`\vec{\rho}`.
+
+        """
+        c1 = (dW**2 - dt)/two
+        c2 = dW*dt - dZ
+        c3 = (dW**2/three - dt)*dW/two
+        coeffs[0] = k_rho*dW*dt
+        coeffs[1] = (dW + two*k_rho*c1 + (k_G_rho + k_rho**2)*c2 +
+                     three*(k_G_rho + two*k_rho**2)*c3)
+        coeffs[2] = dW**2/two + three*k_rho*c3
+        coeffs[3] = c3
+        coeffs[4] = dZ
+        coeffs[5] = c2
+        return (k_rho*dW + (k_G_rho + two*k_rho**2)*c1 +
+                (k_Q_rho + (k_G_rho + k_rho**2)*k_rho)*c2 +
+                (k_G2_rho + six*k_rho*k_G_rho + six*k_rho**3)*c3)
+
+    return taylor_1_5_coeffs
+
+def make_taylor_1_5_increments(dtype):
+    r"""Build the function computing the increments of a Taylor 1.5 step.
+
+    Like ``make_taylor_1_5_coeffs``, the returned plain function is shared by
+    the CPU kernels (through ``taylor_1_5_increments``) and the CUDA kernels,
+    and its numerical constants have type `dtype`.
+
+    Parameters
+    ----------
+    dtype: numpy.dtype
+        The floating-point type of the constants.
+
+    Returns
+    -------
+    function
+        The increment function.
+
+    """
+    two, sqrt3 = np.array([2, np.sqrt(3)], dtype=dtype)
+
+    def taylor_1_5_increments(U1, U2, sqrtdt, dt):
+        r"""Increments of an order 1.5 Taylor step of the homodyne SME.
+
+        Parameters
+        ----------
+        U1: float
+            Standard-normal sample used to construct :math:`\Delta W`.
+        U2: float
+            Standard-normal sample used to construct :math:`\Delta Z`.
+        sqrtdt: float
+            The square root of the step size.
+        dt: float
+            The step size.
+
+        Returns
+        -------
+        tuple of float
+            The Wiener increment :math:`\Delta W` and the multiple-Ito
+            increment :math:`\Delta Z`.
+
+        """
+        return U1*sqrtdt, (U1 + U2/sqrt3)*sqrtdt*dt/two
+
+    return taylor_1_5_increments
+
+def milstein_coeffs(dW, dt, k_rho, k_G_rho, coeffs):
+    r"""Coefficients of a Milstein step in the dtype of `coeffs`.
+
+    Calls the function built by ``make_milstein_coeffs`` for the dtype of
+    `coeffs`. Compiled kernels inline the implementation for that dtype, so
+    single-precision kernels stay in single precision.
+
+    """
+    return make_milstein_coeffs(coeffs.dtype)(dW, dt, k_rho, k_G_rho, coeffs)
+
+@overload(milstein_coeffs, inline='always')
+def milstein_coeffs_overload(dW, dt, k_rho, k_G_rho, coeffs):
+    return make_milstein_coeffs(as_dtype(coeffs.dtype))
+
+def taylor_1_5_coeffs(dW, dZ, dt, k_rho, k_G_rho, k_G2_rho, k_Q_rho, coeffs):
+    r"""Coefficients of a Taylor 1.5 step in the dtype of `coeffs`.
+
+    Calls the function built by ``make_taylor_1_5_coeffs`` for the dtype of
+    `coeffs`. Compiled kernels inline the implementation for that dtype, so
+    single-precision kernels stay in single precision.
+
+    """
+    return make_taylor_1_5_coeffs(coeffs.dtype)(dW, dZ, dt, k_rho, k_G_rho,
+                                                k_G2_rho, k_Q_rho, coeffs)
+
+@overload(taylor_1_5_coeffs, inline='always')
+def taylor_1_5_coeffs_overload(dW, dZ, dt, k_rho, k_G_rho, k_G2_rho, k_Q_rho,
+                               coeffs):
+    return make_taylor_1_5_coeffs(as_dtype(coeffs.dtype))
+
+def taylor_1_5_increments(U1, U2, sqrtdt, dt):
+    r"""Increments of a Taylor 1.5 step in the floating-point type of `U1`.
+
+    Calls the function built by ``make_taylor_1_5_increments`` for the type
+    of `U1`. Compiled kernels inline the implementation for that type, so
+    single-precision kernels stay in single precision.
+
+    """
+    return make_taylor_1_5_increments(np.asarray(U1).dtype)(U1, U2, sqrtdt,
+                                                            dt)
+
+@overload(taylor_1_5_increments, inline='always')
+def taylor_1_5_increments_overload(U1, U2, sqrtdt, dt):
+    return make_taylor_1_5_increments(as_dtype(U1))
+
+@njit(cache=True, fastmath=True)
+def euler_homodyne(ops, rho_0, dt, U1s, U2s=None):
+    r"""Euler integration of the homodyne SME from stacked operators.
+
+    Each step is :math:`M_0\vec{\rho}+\Delta W(\vec{k}^T\vec{\rho}\,
+    \vec{\rho}+G\vec{\rho})` with :math:`M_0=I+Q\Delta t`, so it only
+    needs one product with the stacked operator and no calls back into
+    Python.
+
+    Parameters
+    ----------
+    ops: numpy.array
+        :math:`\vec{k}^T`, :math:`M_0`, and :math:`G` stacked by
+        ``EulerHomodyneIntegrator.prepare_step``.
+    rho_0: numpy.array
+        The initial vectorized state.
+    dt: float
+        The step size.
+    U1s: numpy.array(steps)
+        Samples from a standard-normal distribution used to construct Wiener
+        increments :math:`\Delta W` for each time interval.
+    U2s: numpy.array(steps), optional
+        Unused, included to make the argument list uniform with
+        ``taylor_1_5_homodyne``.
+
+    Returns
+    -------
+    numpy.array, shape=(steps + 1, len(rho_0))
+        The vectorized state at each time, with the dtype of `rho_0`.
+
+    """
+    dim = rho_0.shape[0]
+    steps = U1s.shape[0]
+    sqrtdt = np.sqrt(dt)
+    rhos = np.empty((steps + 1, dim), rho_0.dtype)
+    rhos[0] = rho_0
+
+    for n in range(steps):
+        dW = U1s[n]*sqrtdt
+        rho = rhos[n]
+        prods = np.dot(ops, rho)
+        rho_coeff = prods[0]*dW
+        for j in range(dim):
+            rhos[n+1,j] = (prods[1+j] + rho_coeff*rho[j] +
+                           dW*prods[1+dim+j])
+
+    return rhos
+
+@njit(cache=True, fastmath=True)
+def milstein_homodyne(ops, rho_0, dt, U1s, U2s=None):
+    r"""Milstein integration of the homodyne SME from stacked operators.
+
+    Every term in the Milstein step is a linear combination of
+    :math:`M_0\vec{\rho}`, :math:`G\vec{\rho}`, :math:`G^2\vec{\rho}`, and
+    :math:`\vec{\rho}` with coefficients depending on
+    :math:`\vec{k}^T\vec{\rho}` and :math:`\vec{k}^TG\vec{\rho}`, where
+    :math:`M_0=I+Q\Delta t-G^2\Delta t/2` collects the terms that only depend
+    on the step size, so each step only needs one product with the stacked
+    operator.
+
+    Parameters
+    ----------
+    ops: numpy.array
+        :math:`\vec{k}^T`, :math:`\vec{k}^TG`, :math:`M_0`, :math:`G`, and
+        :math:`G^2` stacked by ``MilsteinHomodyneIntegrator.prepare_step``.
+    rho_0: numpy.array
+        The initial vectorized state.
+    dt: float
+        The step size.
+    U1s: numpy.array(steps)
+        Samples from a standard-normal distribution used to construct Wiener
+        increments :math:`\Delta W` for each time interval.
+    U2s: numpy.array(steps), optional
+        Unused, included to make the argument list uniform with
+        ``taylor_1_5_homodyne``.
+
+    Returns
+    -------
+    numpy.array, shape=(steps + 1, len(rho_0))
+        The vectorized state at each time, with the dtype of `rho_0`.
+
+    """
+    dim = rho_0.shape[0]
+    steps = U1s.shape[0]
+    sqrtdt = np.sqrt(dt)
+    rhos = np.empty((steps + 1, dim), rho_0.dtype)
+    rhos[0] = rho_0
+    coeffs = np.empty(2, rho_0.dtype)
+
+    for n in range(steps):
+        dW = U1s[n]*sqrtdt
+        rho = rhos[n]
+        prods = np.dot(ops, rho)
+        rho_coeff = milstein_coeffs(dW, dt, prods[0], prods[1], coeffs)
+        for j in range(dim):
+            rhos[n+1,j] = (prods[2+j] + rho_coeff*rho[j] +
+                           coeffs[0]*prods[2+dim+j] +
+                           coeffs[1]*prods[2+2*dim+j])
+
+    return rhos
+
+@njit(cache=True, fastmath=True)
+def taylor_1_5_homodyne(ops, rho_0, dt, U1s, U2s):
+    r"""Order 1.5 Taylor integration of the homodyne SME from stacked operators.
+
+    Every term in the Taylor step is a linear combination of :math:`\vec{\rho}`
+    and the products of :math:`\vec{\rho}` with :math:`M_0`, :math:`Q`,
+    :math:`G`, :math:`G^2`, :math:`G^3`, :math:`QG`, and :math:`GQ`, with
+    coefficients depending on the dot products of :math:`\vec{\rho}` with
+    :math:`\vec{k}^T`, :math:`\vec{k}^TG`, :math:`\vec{k}^TG^2`, and
+    :math:`\vec{k}^TQ`, where :math:`M_0=I+Q\Delta t-G^2\Delta t/2+
+    Q^2\Delta t^2/2` collects the terms that only depend on the step size, so
+    each step only needs one product with the stacked operator.
+
+    Parameters
+    ----------
+    ops: numpy.array
+        :math:`\vec{k}^T`, :math:`\vec{k}^TG`, :math:`\vec{k}^TG^2`,
+        :math:`\vec{k}^TQ`, :math:`M_0`, :math:`Q`, :math:`G`, :math:`G^2`,
+        :math:`G^3`, :math:`QG`, and :math:`GQ` stacked by
+        ``Taylor_1_5_HomodyneIntegrator.prepare_step``.
+    rho_0: numpy.array
+        The initial vectorized state.
+    dt: float
+        The step size.
+    U1s: numpy.array(steps)
+        Samples from a standard-normal distribution used to construct Wiener
+        increments :math:`\Delta W` for each time interval.
+    U2s: numpy.array(steps)
+        Samples from a standard-normal distribution used to construct
+        multiple-Ito increments :math:`\Delta Z` for each time interval.
+
+    Returns
+    -------
+    numpy.array, shape=(steps + 1, len(rho_0))
+        The vectorized state at each time, with the dtype of `rho_0`.
+
+    """
+    dim = rho_0.shape[0]
+    steps = U1s.shape[0]
+    sqrtdt = np.sqrt(dt)
+    rhos = np.empty((steps + 1, dim), rho_0.dtype)
+    rhos[0] = rho_0
+    coeffs = np.empty(6, rho_0.dtype)
+
+    for n in range(steps):
+        dW, dZ = taylor_1_5_increments(U1s[n], U2s[n], sqrtdt, dt)
+        rho = rhos[n]
+        prods = np.dot(ops, rho)
+        rho_coeff = taylor_1_5_coeffs(dW, dZ, dt, prods[0], prods[1],
+                                      prods[2], prods[3], coeffs)
+        for j in range(dim):
+            rho_next = prods[4+j] + rho_coeff*rho[j]
+            for m in range(6):
+                rho_next += coeffs[m]*prods[4+(m+1)*dim+j]
+            rhos[n+1,j] = rho_next
+
+    return rhos
+
+@njit(cache=True, fastmath=True)
+def euler_homodyne_batch(ops, rho_0, dt, U1s, U2s=None):
+    r"""Euler integration of a batch of homodyne trajectories.
+
+    Same scheme as ``euler_homodyne``, but with the trajectories stored as the
+    columns of a matrix so each step is a single matrix-matrix product with
+    the stacked operator.
+
+    Parameters
+    ----------
+    ops: numpy.array
+        :math:`\vec{k}^T`, :math:`M_0`, and :math:`G` stacked by
+        ``EulerHomodyneIntegrator.prepare_step``.
+    rho_0: numpy.array
+        The initial vectorized state shared by all trajectories.
+    dt: float
+        The step size.
+    U1s: numpy.array(trajectories, steps)
+        Samples from a standard-normal distribution used to construct Wiener
+        increments :math:`\Delta W` for each trajectory and time interval.
+    U2s: numpy.array(trajectories, steps), optional
+        Unused, included to make the argument list uniform with
+        ``taylor_1_5_homodyne_batch``.
+
+    Returns
+    -------
+    numpy.array, shape=(steps + 1, len(rho_0), trajectories)
+        The vectorized state of each trajectory at each time, with the dtype
+        of `rho_0`.
+
+    """
+    dim = rho_0.shape[0]
+    trajectories, steps = U1s.shape
+    sqrtdt = np.sqrt(dt)
+    rhos = np.empty((steps + 1, dim, trajectories), rho_0.dtype)
+    for j in range(dim):
+        rhos[0,j,:] = rho_0[j]
+    dWs = np.empty(trajectories, rho_0.dtype)
+    rho_coeffs = np.empty(trajectories, rho_0.dtype)
+
+    for n in range(steps):
+        rho = rhos[n]
+        prods = np.dot(ops, rho)
+        for t in range(trajectories):
+            dWs[t] = U1s[t,n]*sqrtdt
+            rho_coeffs[t] = prods[0,t]*dWs[t]
+        for j in range(dim):
+            for t in range(trajectories):
+                rhos[n+1,j,t] = (prods[1+j,t] + rho_coeffs[t]*rho[j,t] +
+                                 dWs[t]*prods[1+dim+j,t])
+
+    return rhos
+
+@njit(cache=True, fastmath=True)
+def milstein_homodyne_batch(ops, rho_0, dt, U1s, U2s=None):
+    r"""Milstein integration of a batch of homodyne trajectories.
+
+    Same scheme as ``milstein_homodyne``, but with the trajectories stored as
+    the columns of a matrix so each step is a single matrix-matrix product
+    with the stacked operator.
+
+    Parameters
+    ----------
+    ops: numpy.array
+        :math:`\vec{k}^T`, :math:`\vec{k}^TG`, :math:`M_0`, :math:`G`, and
+        :math:`G^2` stacked by ``MilsteinHomodyneIntegrator.prepare_step``.
+    rho_0: numpy.array
+        The initial vectorized state shared by all trajectories.
+    dt: float
+        The step size.
+    U1s: numpy.array(trajectories, steps)
+        Samples from a standard-normal distribution used to construct Wiener
+        increments :math:`\Delta W` for each trajectory and time interval.
+    U2s: numpy.array(trajectories, steps), optional
+        Unused, included to make the argument list uniform with
+        ``taylor_1_5_homodyne_batch``.
+
+    Returns
+    -------
+    numpy.array, shape=(steps + 1, len(rho_0), trajectories)
+        The vectorized state of each trajectory at each time, with the dtype
+        of `rho_0`.
+
+    """
+    dim = rho_0.shape[0]
+    trajectories, steps = U1s.shape
+    sqrtdt = np.sqrt(dt)
+    rhos = np.empty((steps + 1, dim, trajectories), rho_0.dtype)
+    for j in range(dim):
+        rhos[0,j,:] = rho_0[j]
+    rho_coeffs = np.empty(trajectories, rho_0.dtype)
+    coeffs = np.empty((trajectories, 2), rho_0.dtype)
+
+    for n in range(steps):
+        rho = rhos[n]
+        prods = np.dot(ops, rho)
+        for t in range(trajectories):
+            rho_coeffs[t] = milstein_coeffs(U1s[t,n]*sqrtdt, dt, prods[0,t],
+                                            prods[1,t], coeffs[t])
+        for j in range(dim):
+            for t in range(trajectories):
+                rhos[n+1,j,t] = (prods[2+j,t] + rho_coeffs[t]*rho[j,t] +
+                                 coeffs[t,0]*prods[2+dim+j,t] +
+                                 coeffs[t,1]*prods[2+2*dim+j,t])
+
+    return rhos
+
+@njit(cache=True, fastmath=True)
+def taylor_1_5_homodyne_batch(ops, rho_0, dt, U1s, U2s):
+    r"""Order 1.5 Taylor integration of a batch of homodyne trajectories.
+
+    Same scheme as ``taylor_1_5_homodyne``, but with the trajectories stored
+    as the columns of a matrix so each step is a single matrix-matrix product
+    with the stacked operator.
+
+    Parameters
+    ----------
+    ops: numpy.array
+        The operators stacked by
+        ``Taylor_1_5_HomodyneIntegrator.prepare_step``.
+    rho_0: numpy.array
+        The initial vectorized state shared by all trajectories.
+    dt: float
+        The step size.
+    U1s: numpy.array(trajectories, steps)
+        Samples from a standard-normal distribution used to construct Wiener
+        increments :math:`\Delta W` for each trajectory and time interval.
+    U2s: numpy.array(trajectories, steps)
+        Samples from a standard-normal distribution used to construct
+        multiple-Ito increments :math:`\Delta Z` for each trajectory and time
+        interval.
+
+    Returns
+    -------
+    numpy.array, shape=(steps + 1, len(rho_0), trajectories)
+        The vectorized state of each trajectory at each time, with the dtype
+        of `rho_0`.
+
+    """
+    dim = rho_0.shape[0]
+    trajectories, steps = U1s.shape
+    sqrtdt = np.sqrt(dt)
+    rhos = np.empty((steps + 1, dim, trajectories), rho_0.dtype)
+    for j in range(dim):
+        rhos[0,j,:] = rho_0[j]
+    rho_coeffs = np.empty(trajectories, rho_0.dtype)
+    coeffs = np.empty((trajectories, 6), rho_0.dtype)
+
+    for n in range(steps):
+        rho = rhos[n]
+        prods = np.dot(ops, rho)
+        for t in range(trajectories):
+            dW, dZ = taylor_1_5_increments(U1s[t,n], U2s[t,n], sqrtdt, dt)
+            rho_coeffs[t] = taylor_1_5_coeffs(dW, dZ, dt, prods[0,t],
+                                              prods[1,t], prods[2,t],
+                                              prods[3,t], coeffs[t])
+        for j in range(dim):
+            for t in range(trajectories):
+                rho_next = prods[4+j,t] + rho_coeffs[t]*rho[j,t]
+                for m in range(6):
+                    rho_next += coeffs[t,m]*prods[4+(m+1)*dim+j,t]
+                rhos[n+1,j,t] = rho_next
+
+    return rhos
+
+def make_euler_homodyne(dim):
+    r"""Compile ``euler_homodyne`` specialized to a state size.
+
+    Parameters
+    ----------
+    dim: int
+        The length of the vectorized state.
+
+    Returns
+    -------
+    function
+        A compiled function with the same arguments as ``euler_homodyne``.
+
+    """
+    rows = 1 + 2*dim
+
+    @njit(fastmath=True)
+    def euler_homodyne_specialized(ops, rho_0, dt, U1s, U2s=None):
+        steps = U1s.shape[0]
+        sqrtdt = np.sqrt(dt)
+        rhos = np.empty((steps + 1, dim), rho_0.dtype)
+        rhos[0] = rho_0
+        prods = np.empty(rows, rho_0.dtype)
+
+        for n in range(steps):
+            rho = rhos[n]
+            for i in range(rows):
+                prod = ops[i,0]*rho[0]
+                for j in range(1, dim):
+                    prod += ops[i,j]*rho[j]
+                prods[i] = prod
+            dW = U1s[n]*sqrtdt
+            rho_coeff = prods[0]*dW
+            for j in range(dim):
+                rhos[n+1,j] = (prods[1+j] + rho_coeff*rho[j] +
+                               dW*prods[1+dim+j])
+
+        return rhos
+
+    return euler_homodyne_specialized
+
+def make_milstein_homodyne(dim):
+    r"""Compile ``milstein_homodyne`` specialized to a state size.
+
+    The state size is frozen into the compiled code as a constant, so the
+    products with the stacked operator are written as loops of fixed length
+    that the compiler can unroll. The step size is still passed at run time,
+    so a single compilation serves every grid.
+
+    Parameters
+    ----------
+    dim: int
+        The length of the vectorized state.
+
+    Returns
+    -------
+    function
+        A compiled function with the same arguments as ``milstein_homodyne``.
+
+    """
+    rows = 2 + 3*dim
+
+    @njit(fastmath=True)
+    def milstein_homodyne_specialized(ops, rho_0, dt, U1s, U2s=None):
+        steps = U1s.shape[0]
+        sqrtdt = np.sqrt(dt)
+        rhos = np.empty((steps + 1, dim), rho_0.dtype)
+        rhos[0] = rho_0
+        prods = np.empty(rows, rho_0.dtype)
+        coeffs = np.empty(2, rho_0.dtype)
+
+        for n in range(steps):
+            rho = rhos[n]
+            for i in range(rows):
+                prod = ops[i,0]*rho[0]
+                for j in range(1, dim):
+                    prod += ops[i,j]*rho[j]
+                prods[i] = prod
+            rho_coeff = milstein_coeffs(U1s[n]*sqrtdt, dt, prods[0],
+                                        prods[1], coeffs)
+            for j in range(dim):
+                rhos[n+1,j] = (prods[2+j] + rho_coeff*rho[j] +
+                               coeffs[0]*prods[2+dim+j] +
+                               coeffs[1]*prods[2+2*dim+j])
+
+        return rhos
+
+    return milstein_homodyne_specialized
+
+def make_taylor_1_5_homodyne(dim):
+    r"""Compile ``taylor_1_5_homodyne`` specialized to a state size.
+
+    Parameters
+    ----------
+    dim: int
+        The length of the vectorized state.
+
+    Returns
+    -------
+    function
+        A compiled function with the same arguments as
+        ``taylor_1_5_homodyne``.
+
+    """
+    rows = 4 + 7*dim
+
+    @njit(fastmath=True)
+    def taylor_1_5_homodyne_specialized(ops, rho_0, dt, U1s, U2s):
+        steps = U1s.shape[0]
+        sqrtdt = np.sqrt(dt)
+        rhos = np.empty((steps + 1, dim), rho_0.dtype)
+        rhos[0] = rho_0
+        prods = np.empty(rows, rho_0.dtype)
+        coeffs = np.empty(6, rho_0.dtype)
+
+        for n in range(steps):
+            rho = rhos[n]
+            for i in range(rows):
+                prod = ops[i,0]*rho[0]
+                for j in range(1, dim):
+                    prod += ops[i,j]*rho[j]
+                prods[i] = prod
+            dW, dZ = taylor_1_5_increments(U1s[n], U2s[n], sqrtdt, dt)
+            rho_coeff = taylor_1_5_coeffs(dW, dZ, dt, prods[0], prods[1],
+                                          prods[2], prods[3], coeffs)
+            for j in range(dim):
+                rho_next = prods[4+j] + rho_coeff*rho[j]
+                for m in range(6):
+                    rho_next += coeffs[m]*prods[4+(m+1)*dim+j]
+                rhos[n+1,j] = rho_next
+
+        return rhos
+
+    return taylor_1_5_homodyne_specialized
+
+SPECIALIZED_KERNELS = {}
+KERNEL_FACTORIES = {euler_homodyne: make_euler_homodyne,
+                    milstein_homodyne: make_milstein_homodyne,
+                    taylor_1_5_homodyne: make_taylor_1_5_homodyne}
+
+def specialized_kernel(kernel, dim):
+    r"""Return a kernel specialized to a state size.
+
+    Specialized kernels are compiled on first use (which is not cached
+    between sessions) and kept for each combination of `kernel` and `dim`.
+    They take the step size at run time, so sweeping over step sizes reuses
+    one kernel (and one compilation of ``grid_conv.grid_final_states``).
+
+    Parameters
+    ----------
+    kernel: function
+        A generic compiled kernel, such as ``taylor_1_5_homodyne``.
+    dim: int
+        The length of the vectorized state.
+
+    Returns
+    -------
+    function
+        The specialized compiled kernel.
+
+    """
+    key = (kernel, dim)
+    if key not in SPECIALIZED_KERNELS:
+        SPECIALIZED_KERNELS[key] = KERNEL_FACTORIES[kernel](dim)
+    return SPECIALIZED_KERNELS[key]
+
+def make_euler_homodyne_cuda(dim, dtype):
+    r"""Compile a CUDA kernel integrating Euler trajectories to the end.
+
+    The kernel runs one trajectory per thread, keeping the state in
+    thread-local memory (sized at compile time by `dim`) and writing only the
+    final state. All arithmetic is done in `dtype`, so the step size and
+    noise must be passed in `dtype` as well.
+
+    Parameters
+    ----------
+    dim: int
+        The length of the vectorized state.
+    dtype: numpy.dtype
+        The floating-point type of the state.
+
+    Returns
+    -------
+    numba.cuda kernel
+        A kernel taking the operators stacked by
+        ``EulerHomodyneIntegrator.prepare_step``, the initial state, the step
+        size, ``U1s`` and ``U2s`` of shape ``(trajectories, steps)``, and an
+        output array of shape ``(trajectories, dim)`` for the final states.
+
+    """
+    rows = 1 + 2*dim
+    local_type = numba.from_dtype(dtype)
+    zero = np.dtype(dtype).type(0)
+
+    @cuda.jit
+    def euler_homodyne_cuda(ops, rho_0, dt, U1s, U2s, final_rhos):
+        t = cuda.grid(1)
+        if t >= U1s.shape[0]:
+            return
+        rho = cuda.local.array(dim, local_type)
+        prods = cuda.local.array(rows, local_type)
+        for j in range(dim):
+            rho[j] = rho_0[j]
+        sqrtdt = math.sqrt(dt)
+
+        for n in range(U1s.shape[1]):
+            for i in range(rows):
+                prod = zero
+                for j in range(dim):
+                    prod += ops[i,j]*rho[j]
+                prods[i] = prod
+            dW = U1s[t,n]*sqrtdt
+            rho_coeff = prods[0]*dW
+            # Each component of rho is only read again for its own update
+            # once the products are computed, so update in place
+            for j in range(dim):
+                rho[j] = prods[1+j] + rho_coeff*rho[j] + dW*prods[1+dim+j]
+
+        for j in range(dim):
+            final_rhos[t,j] = rho[j]
+
+    return euler_homodyne_cuda
+
+def make_milstein_homodyne_cuda(dim, dtype):
+    r"""Compile a CUDA kernel integrating Milstein trajectories to the end.
+
+    The kernel runs one trajectory per thread, keeping the state in
+    thread-local memory (sized at compile time by `dim`) and writing only the
+    final state. All arithmetic is done in `dtype`, so the step size and
+    noise must be passed in `dtype` as well.
+
+    Parameters
+    ----------
+    dim: int
+        The length of the vectorized state.
+    dtype: numpy.dtype
+        The floating-point type of the state.
+
+    Returns
+    -------
+    numba.cuda kernel
+        A kernel taking the operators stacked by
+        ``MilsteinHomodyneIntegrator.prepare_step``, the initial state, the
+        step size, ``U1s`` and ``U2s`` of shape ``(trajectories, steps)``, and
+        an output array of shape ``(trajectories, dim)`` for the final states.
+
+    """
+    rows = 2 + 3*dim
+    local_type = numba.from_dtype(dtype)
+    zero = np.dtype(dtype).type(0)
+    milstein_coeffs_device = cuda.jit(device=True)(
+            make_milstein_coeffs(dtype))
+
+    @cuda.jit
+    def milstein_homodyne_cuda(ops, rho_0, dt, U1s, U2s, final_rhos):
+        t = cuda.grid(1)
+        if t >= U1s.shape[0]:
+            return
+        rho = cuda.local.array(dim, local_type)
+        prods = cuda.local.array(rows, local_type)
+        coeffs = cuda.local.array(2, local_type)
+        for j in range(dim):
+            rho[j] = rho_0[j]
+        sqrtdt = math.sqrt(dt)
+
+        for n in range(U1s.shape[1]):
+            for i in range(rows):
+                prod = zero
+                for j in range(dim):
+                    prod += ops[i,j]*rho[j]
+                prods[i] = prod
+            rho_coeff = milstein_coeffs_device(U1s[t,n]*sqrtdt, dt, prods[0],
+                                               prods[1], coeffs)
+            # Each component of rho is only read again for its own update
+            # once the products are computed, so update in place
+            for j in range(dim):
+                rho[j] = (prods[2+j] + rho_coeff*rho[j] +
+                          coeffs[0]*prods[2+dim+j] +
+                          coeffs[1]*prods[2+2*dim+j])
+
+        for j in range(dim):
+            final_rhos[t,j] = rho[j]
+
+    return milstein_homodyne_cuda
+
+def make_taylor_1_5_homodyne_cuda(dim, dtype):
+    r"""Compile a CUDA kernel integrating Taylor 1.5 trajectories to the end.
+
+    The kernel runs one trajectory per thread, keeping the state in
+    thread-local memory (sized at compile time by `dim`) and writing only the
+    final state. All arithmetic is done in `dtype`, so the step size and
+    noise must be passed in `dtype` as well.
+
+    Parameters
+    ----------
+    dim: int
+        The length of the vectorized state.
+    dtype: numpy.dtype
+        The floating-point type of the state.
+
+    Returns
+    -------
+    numba.cuda kernel
+        A kernel taking the operators stacked by
+        ``Taylor_1_5_HomodyneIntegrator.prepare_step``, the initial state, the
+        step size, ``U1s`` and ``U2s`` of shape ``(trajectories, steps)``, and
+        an output array of shape ``(trajectories, dim)`` for the final states.
+
+    """
+    rows = 4 + 7*dim
+    local_type = numba.from_dtype(dtype)
+    zero = np.dtype(dtype).type(0)
+    taylor_1_5_coeffs_device = cuda.jit(device=True)(
+            make_taylor_1_5_coeffs(dtype))
+    taylor_1_5_increments_device = cuda.jit(device=True)(
+            make_taylor_1_5_increments(dtype))
+
+    @cuda.jit
+    def taylor_1_5_homodyne_cuda(ops, rho_0, dt, U1s, U2s, final_rhos):
+        t = cuda.grid(1)
+        if t >= U1s.shape[0]:
+            return
+        rho = cuda.local.array(dim, local_type)
+        prods = cuda.local.array(rows, local_type)
+        coeffs = cuda.local.array(6, local_type)
+        for j in range(dim):
+            rho[j] = rho_0[j]
+        sqrtdt = math.sqrt(dt)
+
+        for n in range(U1s.shape[1]):
+            for i in range(rows):
+                prod = zero
+                for j in range(dim):
+                    prod += ops[i,j]*rho[j]
+                prods[i] = prod
+            dW, dZ = taylor_1_5_increments_device(U1s[t,n], U2s[t,n],
+                                                  sqrtdt, dt)
+            rho_coeff = taylor_1_5_coeffs_device(dW, dZ, dt, prods[0],
+                                                 prods[1], prods[2], prods[3],
+                                                 coeffs)
+            # Each component of rho is only read again for its own update
+            # once the products are computed, so update in place
+            for j in range(dim):
+                rho_next = prods[4+j] + rho_coeff*rho[j]
+                for m in range(6):
+                    rho_next += coeffs[m]*prods[4+(m+1)*dim+j]
+                rho[j] = rho_next
+
+        for j in range(dim):
+            final_rhos[t,j] = rho[j]
+
+    return taylor_1_5_homodyne_cuda
+
+CUDA_KERNELS = {}
+CUDA_KERNEL_FACTORIES = {euler_homodyne: make_euler_homodyne_cuda,
+                         milstein_homodyne: make_milstein_homodyne_cuda,
+                         taylor_1_5_homodyne: make_taylor_1_5_homodyne_cuda}
+
+def cuda_kernel(kernel, dim, dtype):
+    r"""Return the CUDA counterpart of a compiled kernel.
+
+    CUDA kernels are compiled on first use and cached for each combination of
+    `kernel`, `dim`, and `dtype`.
+
+    Parameters
+    ----------
+    kernel: function
+        A generic compiled kernel, such as ``taylor_1_5_homodyne``.
+    dim: int
+        The length of the vectorized state.
+    dtype: numpy.dtype
+        The floating-point type of the state.
+
+    Returns
+    -------
+    numba.cuda kernel
+        The CUDA kernel integrating one trajectory per thread.
+
+    """
+    key = (kernel, dim, np.dtype(dtype))
+    if key not in CUDA_KERNELS:
+        CUDA_KERNELS[key] = CUDA_KERNEL_FACTORIES[kernel](dim, key[2])
+    return CUDA_KERNELS[key]
+
 class Solution:
     r"""Integrated solution to a differential equation.
 
@@ -241,7 +1257,7 @@ class Solution:
             The density matrix at each calculated time.
 
         """
-        return np.einsum('jk,kmn->jmn', self.vec_soln, self.basis)
+        return np.einsum('...k,kmn->...mn', self.vec_soln, self.basis)
 
     def get_density_matrices_slow(self):
         r"""Represent the solution as a sequence of Hermitian arrays.
@@ -338,8 +1354,23 @@ class UncondGaussIntegrator(GaussIntegrator):
         :rtype:         `Solution`
 
         """
-        rho_0_vec = sb.vectorize(rho_0, self.basis).real
-        vec_soln = odeint(self.a_fn, rho_0_vec, times, Dfun=self.Dfun)
+        rho_0_vec = np.ascontiguousarray(sb.vectorize(rho_0, self.basis).real)
+        times = np.asarray(times)
+        dt = step_size(times)
+        if dt is not None:
+            # The equation is linear with constant Q, so the solution is the
+            # action of the matrix exponential on rho_0
+            vec_soln = expm_multiply(self.Q, rho_0_vec, start=0,
+                                     stop=times[-1] - times[0],
+                                     num=len(times), endpoint=True)
+        else:
+            vec_soln = np.empty((len(times), len(rho_0_vec)))
+            vec_soln[0] = rho_0_vec
+            propagators = {}
+            for n, dt in enumerate(np.diff(times)):
+                if dt not in propagators:
+                    propagators[dt] = expm(self.Q*dt)
+                vec_soln[n+1] = np.dot(propagators[dt], vec_soln[n])
         return Solution(vec_soln, self.basis)
 
     def integrate_non_herm(self, rho_0, times, method='BDF'):
@@ -394,10 +1425,25 @@ class Strong_0_5_HomodyneIntegrator(GaussIntegrator):
         The real matrix G and row vector k_T that act on the vectorized rho as
         the stochastic evolution operator.  Will save computation time if
         already known and don't need to calculate from `c_op`, `M_sq`, and `N`.
+    dtype : numpy.dtype, optional
+        The floating-point type used by the compiled integration kernel.
+        ``numpy.float32`` halves the memory traffic per step, which is enough
+        precision for convergence-rate experiments. Defaults to
+        ``numpy.float64``.
+    specialize : bool, optional
+        Whether to integrate with kernels compiled for the particular state
+        size (see ``specialized_kernel``), trading a compilation for each new
+        state size for faster steps. Defaults to ``False``.
 
     """
+    strong_order = 0.5
+    # Enough step sizes for the fine, doubled, and quadrupled grids compared by
+    # grid_conv.calc_rate
+    max_prepared = 3
+
     def __init__(self, c_op, M_sq, N, H, basis=None, drift_rep=None,
-                 diffusion_reps=None, **kwargs):
+                 diffusion_reps=None, dtype=np.float64, specialize=False,
+                 **kwargs):
         super(Strong_0_5_HomodyneIntegrator, self).__init__(c_op, M_sq, N, H,
                                                             basis, drift_rep,
                                                             **kwargs)
@@ -407,10 +1453,23 @@ class Strong_0_5_HomodyneIntegrator(GaussIntegrator):
                                                   self.basis[:-1])
         else:
             self.G = diffusion_reps['G']
-            self.k_T = diffusion_reps['k_T']
+            # Keep k_T 1-D even if supplied as a row vector, so its products
+            # with vectorized states are scalars rather than 1x1 arrays
+            self.k_T = np.ascontiguousarray(np.ravel(diffusion_reps['k_T']))
+        self.dtype = np.dtype(dtype)
+        self.specialize = specialize
+        self.prepared = OrderedDict()
+        self.arrays = cast_arrays(IntegratorArrays(Q=self.Q, G=self.G, G2=None,
+                                                   G3=None, Q2=None, QG=None,
+                                                   GQ=None, k_T=self.k_T,
+                                                   k_T_G=None, k_T_G2=None,
+                                                   k_T_Q=None),
+                                  self.dtype)
 
     def b_fn(self, rho, t):
-        return np.dot(self.k_T, rho)*rho + np.dot(self.G, rho)
+        # G rho + (k_T rho) rho in one BLAS call (y is copied, not overwritten)
+        return dgemv(1.0, self.G.T, rho, beta=np.dot(self.k_T, rho), y=rho,
+                     trans=1)
 
     def dW_fn(self, dM, dt, rho, t):
         return dM + np.dot(self.k_T, rho) * dt
@@ -418,6 +1477,71 @@ class Strong_0_5_HomodyneIntegrator(GaussIntegrator):
     def integrate(self, rho_0, times, U1s=None, U2s=None):
         raise NotImplementedError()
 
+    def kernel_inputs(self, rho_0_vec, dt, *noise):
+        r"""Cast the inputs of a compiled kernel to the integrator's dtype.
+
+        Parameters
+        ----------
+        rho_0_vec: numpy.array
+            The initial vectorized state.
+        dt: float
+            The step size.
+        *noise: numpy.array
+            The standard-normal samples, such as ``U1s`` and ``U2s``.
+
+        Returns
+        -------
+        tuple
+            `rho_0_vec`, `dt`, and each array in `noise` as ``dtype``, in the
+            order the kernels take them, so the kernel does all of its
+            arithmetic in ``dtype``.
+
+        """
+        return ((rho_0_vec.astype(self.dtype), self.dtype.type(dt)) +
+                tuple(np.asarray(U, dtype=self.dtype) for U in noise))
+
+    def step_kernel(self):
+        r"""Return the compiled kernel to integrate with.
+
+        Returns
+        -------
+        function
+            The integrator's ``kernel``, specialized to the state size if the
+            integrator was constructed with ``specialize=True``.
+
+        """
+        if self.specialize:
+            return specialized_kernel(self.kernel, self.arrays.Q.shape[0])
+        return self.kernel
+
+    def prepare(self, dt):
+        r"""Prepare the integrator for steps of a given size.
+
+        The operators stacked by ``prepare_step`` only depend on the step
+        size, so they are built once per step size and reused by subsequent
+        calls to ``integrate``. Only the operators for the ``max_prepared``
+        most recently used step sizes are kept, so sweeping over step sizes
+        does not accumulate them without bound.
+
+        Parameters
+        ----------
+        dt: float
+            The step size.
+
+        Returns
+        -------
+        numpy.array
+            The operators returned by ``prepare_step`` for `dt`.
+
+        """
+        if dt in self.prepared:
+            self.prepared.move_to_end(dt)
+        else:
+            self.prepared[dt] = self.prepare_step(dt)
+            if len(self.prepared) > self.max_prepared:
+                self.prepared.popitem(last=False)
+        return self.prepared[dt]
+
     def gen_meas_record(self, rho_0, times, U1s=None):
         r"""Simulate a measurement record.
 
@@ -459,8 +1583,7 @@ class Strong_0_5_HomodyneIntegrator(GaussIntegrator):
 
         dts = times[1:] - times[:-1]
         dWs = np.sqrt(dts) * U1s
-        tr_c_c_rs = np.array([-np.dot(self.k_T, rho_vec)
-                              for rho_vec in soln.vec_soln[:-1]])
+        tr_c_c_rs = -np.dot(soln.vec_soln[...,:-1,:], self.k_T)
         dMs = dWs + tr_c_c_rs * dts
 
         return soln, dMs
@@ -493,8 +1616,19 @@ class Strong_1_0_HomodyneIntegrator(Strong_0_5_HomodyneIntegrator):
         The real matrix G and row vector k_T that act on the vectorized rho as
         the stochastic evolution operator.  Will save computation time if
         already known and don't need to calculate from `c_op`, `M_sq`, and `N`.
+    dtype : numpy.dtype, optional
+        The floating-point type used by the compiled integration kernel.
+        ``numpy.float32`` halves the memory traffic per step, which is enough
+        precision for convergence-rate experiments. Defaults to
+        ``numpy.float64``.
+    specialize : bool, optional
+        Whether to integrate with kernels compiled for the particular state
+        size (see ``specialized_kernel``), trading a compilation for each new
+        state size for faster steps. Defaults to ``False``.
 
     """
+    strong_order = 1.0
+
     def __init__(self, c_op, M_sq, N, H, basis=None, drift_rep=None,
                  diffusion_reps=None, **kwargs):
         super(Strong_1_0_HomodyneIntegrator, self).__init__(c_op, M_sq, N, H,
@@ -503,6 +1637,9 @@ class Strong_1_0_HomodyneIntegrator(Strong_0_5_HomodyneIntegrator):
                                                             **kwargs)
         self.k_T_G = np.dot(self.k_T, self.G)
         self.G2 = np.dot(self.G, self.G)
+        self.arrays = cast_arrays(self.arrays._replace(G2=self.G2,
+                                                       k_T_G=self.k_T_G),
+                                  self.dtype)
 
 class Strong_1_5_HomodyneIntegrator(Strong_1_0_HomodyneIntegrator):
     r"""Template class for integrators of strong order >= 1.5.
@@ -532,8 +1669,19 @@ class Strong_1_5_HomodyneIntegrator(Strong_1_0_HomodyneIntegrator):
         The real matrix G and row vector k_T that act on the vectorized rho as
         the stochastic evolution operator.  Will save computation time if
         already known and don't need to calculate from `c_op`, `M_sq`, and `N`.
+    dtype : numpy.dtype, optional
+        The floating-point type used by the compiled integration kernel.
+        ``numpy.float32`` halves the memory traffic per step, which is enough
+        precision for convergence-rate experiments. Defaults to
+        ``numpy.float64``.
+    specialize : bool, optional
+        Whether to integrate with kernels compiled for the particular state
+        size (see ``specialized_kernel``), trading a compilation for each new
+        state size for faster steps. Defaults to ``False``.
 
     """
+    strong_order = 1.5
+
     def __init__(self, c_op, M_sq, N, H, basis=None, drift_rep=None,
                  diffusion_reps=None, **kwargs):
         super(Strong_1_5_HomodyneIntegrator, self).__init__(c_op, M_sq, N, H,
@@ -546,6 +1694,11 @@ class Strong_1_5_HomodyneIntegrator(Strong_1_0_HomodyneIntegrator):
         self.GQ = np.dot(self.G, self.Q)
         self.k_T_G2 = np.dot(self.k_T, self.G2)
         self.k_T_Q = np.dot(self.k_T, self.Q)
+        self.arrays = cast_arrays(self.arrays._replace(G3=self.G3, Q2=self.Q2,
+                                                       QG=self.QG, GQ=self.GQ,
+                                                       k_T_G2=self.k_T_G2,
+                                                       k_T_Q=self.k_T_Q),
+                                  self.dtype)
 
 class EulerHomodyneIntegrator(Strong_0_5_HomodyneIntegrator):
     r"""Euler integrator for the conditional Gaussian master equation.
@@ -572,8 +1725,37 @@ class EulerHomodyneIntegrator(Strong_0_5_HomodyneIntegrator):
         The real matrix G and row vector k_T that act on the vectorized rho as
         the stochastic evolution operator.  Will save computation time if
         already known and don't need to calculate from `c_op`, `M_sq`, and `N`.
+    dtype : numpy.dtype, optional
+        The floating-point type used by the compiled integration kernel.
+        ``numpy.float32`` halves the memory traffic per step, which is enough
+        precision for convergence-rate experiments. Defaults to
+        ``numpy.float64``.
+    specialize : bool, optional
+        Whether to integrate with kernels compiled for the particular state
+        size (see ``specialized_kernel``), trading a compilation for each new
+        state size for faster steps. Defaults to ``False``.
 
     """
+    kernel = staticmethod(euler_homodyne)
+
+    def prepare_step(self, dt):
+        r"""Stack the operators used by ``euler_homodyne`` for a step size.
+
+        Parameters
+        ----------
+        dt: float
+            The step size.
+
+        Returns
+        -------
+        numpy.array
+            :math:`\vec{k}^T`, :math:`M_0=I+Q\Delta t`, and :math:`G` stacked
+            by ``stack_ops``.
+
+        """
+        arrays = self.arrays
+        M0 = np.eye(arrays.Q.shape[0], dtype=self.dtype) + dt*arrays.Q
+        return stack_ops([arrays.k_T], [M0, arrays.G])
 
     def integrate(self, rho_0, times, U1s=None, U2s=None):
         r"""Integrate the initial value problem.
@@ -598,14 +1780,35 @@ class EulerHomodyneIntegrator(Strong_0_5_HomodyneIntegrator):
         Returns
         -------
         Solution
-            The state of :math:`\rho` for all specified times
+            The state of :math:`\rho` for all specified times. If `U1s`
+            has multiple rows, ``vec_soln`` has shape
+            ``(len(U1s), len(times), dim)`` and the trajectories are
+            integrated together.
 
         """
-        rho_0_vec = sb.vectorize(rho_0, self.basis).real
+        rho_0_vec = np.ascontiguousarray(sb.vectorize(rho_0, self.basis).real)
         if U1s is None:
             U1s = np.random.randn(len(times) -1)
 
-        vec_soln = sde.euler(self.a_fn, self.b_fn, rho_0_vec, times, U1s)
+        times = np.asarray(times)
+        U1s = np.asarray(U1s)
+        dt = step_size(times)
+        if U1s.ndim == 2:
+            if dt is None:
+                vec_soln = np.array([self.integrate(rho_0, times,
+                                                    U1s_row).vec_soln
+                                     for U1s_row in U1s])
+            else:
+                rhos = euler_homodyne_batch(self.prepare(dt),
+                                            *self.kernel_inputs(rho_0_vec, dt,
+                                                                U1s))
+                vec_soln = np.moveaxis(rhos, -1, 0)
+        elif dt is None:
+            vec_soln = sde.euler(self.a_fn, self.b_fn, rho_0_vec, times, U1s)
+        else:
+            kernel = self.step_kernel()
+            vec_soln = kernel(self.prepare(dt),
+                              *self.kernel_inputs(rho_0_vec, dt, U1s))
         return Solution(vec_soln, self.basis)
 
     def integrate_measurements(self, rho_0, times, dMs):
@@ -627,7 +1830,7 @@ class EulerHomodyneIntegrator(Strong_0_5_HomodyneIntegrator):
             times
 
         """
-        rho_0_vec = sb.vectorize(rho_0, self.basis).real
+        rho_0_vec = np.ascontiguousarray(sb.vectorize(rho_0, self.basis).real)
 
         vec_soln = sde.meas_euler(self.a_fn, self.b_fn, self.dW_fn, rho_0_vec,
                                   times, dMs)
@@ -658,12 +1861,41 @@ class MilsteinHomodyneIntegrator(Strong_1_0_HomodyneIntegrator):
         The real matrix G and row vector k_T that act on the vectorized rho as
         the stochastic evolution operator.  Will save computation time if
         already known and don't need to calculate from `c_op`, `M_sq`, and `N`.
+    dtype : numpy.dtype, optional
+        The floating-point type used by the compiled integration kernel.
+        ``numpy.float32`` halves the memory traffic per step, which is enough
+        precision for convergence-rate experiments. Defaults to
+        ``numpy.float64``.
+    specialize : bool, optional
+        Whether to integrate with kernels compiled for the particular state
+        size (see ``specialized_kernel``), trading a compilation for each new
+        state size for faster steps. Defaults to ``False``.
 
     """
+    kernel = staticmethod(milstein_homodyne)
+
+    def prepare_step(self, dt):
+        r"""Stack the operators used by ``milstein_homodyne`` for a step size.
+
+        Parameters
+        ----------
+        dt: float
+            The step size.
+
+        Returns
+        -------
+        numpy.array
+            :math:`\vec{k}^T`, :math:`\vec{k}^TG`,
+            :math:`M_0=I+Q\Delta t-G^2\Delta t/2`, :math:`G`, and :math:`G^2`
+            stacked by ``stack_ops``.
+
+        """
+        arrays = self.arrays
+        M0 = (np.eye(arrays.Q.shape[0], dtype=self.dtype) + dt*arrays.Q -
+              dt/2*arrays.G2)
+        return stack_ops([arrays.k_T, arrays.k_T_G], [M0, arrays.G, arrays.G2])
 
     def b_dx_b_fn(self, rho, t):
-        # TODO: May want this to be defined by the constructor to facilitate
-        # numba optimization.
         return b_dx_b(self.G2, self.k_T_G, self.G, self.k_T, rho)
 
     def integrate(self, rho_0, times, U1s=None, U2s=None):
@@ -689,15 +1921,36 @@ class MilsteinHomodyneIntegrator(Strong_1_0_HomodyneIntegrator):
         Returns
         -------
         Solution
-            The state of :math:`\rho` for all specified times
+            The state of :math:`\rho` for all specified times. If `U1s`
+            has multiple rows, ``vec_soln`` has shape
+            ``(len(U1s), len(times), dim)`` and the trajectories are
+            integrated together.
 
         """
-        rho_0_vec = sb.vectorize(rho_0, self.basis).real
+        rho_0_vec = np.ascontiguousarray(sb.vectorize(rho_0, self.basis).real)
         if U1s is None:
             U1s = np.random.randn(len(times) -1)
 
-        vec_soln = sde.milstein(self.a_fn, self.b_fn, self.b_dx_b_fn, rho_0_vec,
-                                times, U1s)
+        times = np.asarray(times)
+        U1s = np.asarray(U1s)
+        dt = step_size(times)
+        if U1s.ndim == 2:
+            if dt is None:
+                vec_soln = np.array([self.integrate(rho_0, times,
+                                                    U1s_row).vec_soln
+                                     for U1s_row in U1s])
+            else:
+                rhos = milstein_homodyne_batch(self.prepare(dt),
+                                               *self.kernel_inputs(rho_0_vec,
+                                                                   dt, U1s))
+                vec_soln = np.moveaxis(rhos, -1, 0)
+        elif dt is None:
+            vec_soln = sde.milstein(self.a_fn, self.b_fn, self.b_dx_b_fn,
+                                    rho_0_vec, times, U1s)
+        else:
+            kernel = self.step_kernel()
+            vec_soln = kernel(self.prepare(dt),
+                              *self.kernel_inputs(rho_0_vec, dt, U1s))
         return Solution(vec_soln, self.basis)
 
     def integrate_measurements(self, rho_0, times, dMs):
@@ -719,7 +1972,7 @@ class MilsteinHomodyneIntegrator(Strong_1_0_HomodyneIntegrator):
             times
 
         """
-        rho_0_vec = sb.vectorize(rho_0, self.basis).real
+        rho_0_vec = np.ascontiguousarray(sb.vectorize(rho_0, self.basis).real)
 
         vec_soln = sde.meas_milstein(self.a_fn, self.b_fn, self.b_dx_b_fn,
                                      self.dW_fn, rho_0_vec, times, dMs)
@@ -731,9 +1984,10 @@ class FaultyMilsteinHomodyneIntegrator(MilsteinHomodyneIntegrator):
     of the term that's added to the Euler scheme)
 
     """
+    kernel = None
 
     def integrate(self, rho_0, times, U1s=None, U2s=None):
-        rho_0_vec = sb.vectorize(rho_0, self.basis).real
+        rho_0_vec = np.ascontiguousarray(sb.vectorize(rho_0, self.basis).real)
         if U1s is None:
             U1s = np.random.randn(len(times) -1)
 
@@ -766,13 +2020,50 @@ class Taylor_1_5_HomodyneIntegrator(Strong_1_5_HomodyneIntegrator):
         The real matrix G and row vector k_T that act on the vectorized rho as
         the stochastic evolution operator.  Will save computation time if
         already known and don't need to calculate from `c_op`, `M_sq`, and `N`.
+    dtype : numpy.dtype, optional
+        The floating-point type used by the compiled integration kernel.
+        ``numpy.float32`` halves the memory traffic per step, which is enough
+        precision for convergence-rate experiments. Defaults to
+        ``numpy.float64``.
+    specialize : bool, optional
+        Whether to integrate with kernels compiled for the particular state
+        size (see ``specialized_kernel``), trading a compilation for each new
+        state size for faster steps. Defaults to ``False``.
 
     """
+    kernel = staticmethod(taylor_1_5_homodyne)
+
+    def prepare_step(self, dt):
+        r"""Stack the operators used by ``taylor_1_5_homodyne`` for a step size.
+
+        Parameters
+        ----------
+        dt: float
+            The step size.
+
+        Returns
+        -------
+        numpy.array
+            :math:`\vec{k}^T`, :math:`\vec{k}^TG`, :math:`\vec{k}^TG^2`,
+            :math:`\vec{k}^TQ`, :math:`M_0=I+Q\Delta t-G^2\Delta t/2+
+            Q^2\Delta t^2/2`, :math:`Q`, :math:`G`, :math:`G^2`, :math:`G^3`,
+            :math:`QG`, and :math:`GQ` stacked by ``stack_ops``.
+
+        """
+        arrays = self.arrays
+        M0 = (np.eye(arrays.Q.shape[0], dtype=self.dtype) + dt*arrays.Q -
+              dt/2*arrays.G2 + dt**2/2*arrays.Q2)
+        return stack_ops([arrays.k_T, arrays.k_T_G, arrays.k_T_G2,
+                          arrays.k_T_Q],
+                         [M0, arrays.Q, arrays.G, arrays.G2, arrays.G3,
+                          arrays.QG, arrays.GQ])
+
     def a_fn(self, rho):
         return np.dot(self.Q, rho)
 
     def b_fn(self, rho):
-        return np.dot(self.k_T, rho)*rho + np.dot(self.G, rho)
+        return dgemv(1.0, self.G.T, rho, beta=np.dot(self.k_T, rho), y=rho,
+                     trans=1)
 
     def b_dx_b_fn(self, rho):
         return b_dx_b(self.G2, self.k_T_G, self.G, self.k_T, rho)
@@ -819,21 +2110,45 @@ class Taylor_1_5_HomodyneIntegrator(Strong_1_5_HomodyneIntegrator):
         Returns
         -------
         Solution
-            The state of :math:`\rho` for all specified times
+            The state of :math:`\rho` for all specified times. If `U1s`
+            has multiple rows, ``vec_soln`` has shape
+            ``(len(U1s), len(times), dim)`` and the trajectories are
+            integrated together.
 
         """
-        rho_0_vec = sb.vectorize(rho_0, self.basis).real
+        rho_0_vec = np.ascontiguousarray(sb.vectorize(rho_0, self.basis).real)
         if U1s is None:
             U1s = np.random.randn(len(times) -1)
         if U2s is None:
-            U2s = np.random.randn(len(times) -1)
-
-        vec_soln = sde.time_ind_taylor_1_5(self.a_fn, self.b_fn, self.b_dx_b_fn,
-                                           self.b_dx_a_fn, self.a_dx_b_fn,
-                                           self.a_dx_a_fn, self.b_dx_b_dx_b_fn,
-                                           self.b_b_dx_dx_b_fn,
-                                           self.b_b_dx_dx_a_fn,
-                                           rho_0_vec, times, U1s, U2s)
+            U2s = np.random.randn(*np.shape(U1s))
+
+        times = np.asarray(times)
+        U1s = np.asarray(U1s)
+        U2s = np.asarray(U2s)
+        dt = step_size(times)
+        if U1s.ndim == 2:
+            if dt is None:
+                vec_soln = np.array([self.integrate(rho_0, times, U1s_row,
+                                                    U2s_row).vec_soln
+                                     for U1s_row, U2s_row in zip(U1s, U2s)])
+            else:
+                rhos = taylor_1_5_homodyne_batch(self.prepare(dt),
+                                                 *self.kernel_inputs(rho_0_vec,
+                                                                     dt, U1s,
+                                                                     U2s))
+                vec_soln = np.moveaxis(rhos, -1, 0)
+        elif dt is None:
+            vec_soln = sde.time_ind_taylor_1_5(self.a_fn, self.b_fn,
+                                               self.b_dx_b_fn, self.b_dx_a_fn,
+                                               self.a_dx_b_fn, self.a_dx_a_fn,
+                                               self.b_dx_b_dx_b_fn,
+                                               self.b_b_dx_dx_b_fn,
+                                               self.b_b_dx_dx_a_fn,
+                                               rho_0_vec, times, U1s, U2s)
+        else:
+            kernel = self.step_kernel()
+            vec_soln = kernel(self.prepare(dt),
+                              *self.kernel_inputs(rho_0_vec, dt, U1s, U2s))
         return Solution(vec_soln, self.basis)
 
 class TrDecMilsteinHomodyneIntegrator(MilsteinHomodyneIntegrator):
@@ -851,8 +2166,11 @@ class TrDecMilsteinHomodyneIntegrator(MilsteinHomodyneIntegrator):
                                                               basis, drift_rep,
                                                               diffusion_reps,
                                                               **kwargs)
-        self.k_T = 0
-        self.k_T_G = np.zeros(self.G.shape)
+        self.k_T = np.zeros(self.G.shape[0])
+        self.k_T_G = np.zeros(self.G.shape[0])
+        self.arrays = cast_arrays(self.arrays._replace(k_T=self.k_T,
+                                                       k_T_G=self.k_T_G),
+                                  self.dtype)
 
 class IntegratorFactory:
     r"""Factory that pre-computes things for other integrators.
@@ -57,9 +57,10 @@ def vectorize(operator, basis):
         The vector components
 
     """
-    return np.array([np.tensordot(basis_el.conj().T, operator,
-                                  axes=[[1, 0], [0, 1]]) /
-                     norm_squared(basis_el) for basis_el in basis])
+    basis = np.asarray(basis)
+    basis_conj = basis.conj()
+    norms_sq = np.einsum('jmn,jmn->j', basis_conj, basis).real
+    return np.tensordot(basis_conj, operator, axes=[[1, 2], [0, 1]])/norms_sq
 
 def dualize(operator, basis):
     r"""Take an operator to its dual vectorized form in some operator basis.
@@ -399,7 +400,8 @@ def weiner_op(dim, C_vector, double_prods, basis_norms_sq, basis, **kwargs):
     -------
     tuple(numpy.array)
         The matrix-vector pair :math:`(G,\vec{k})` operating on a vectorized
-        density operator (k is returned as a row-vector)
+        density operator (k is returned as a 1-D array, so its dot product
+        with a vectorized density operator is a scalar)
 
     """
 
@@ -1,14 +1,20 @@
-from nose.tools import assert_almost_equal, assert_equal, assert_true
+from nose import SkipTest
+from nose.tools import (assert_almost_equal, assert_equal, assert_raises,
+                        assert_true)
 import pysme.gellmann as gm
 import pysme.gramschmidt as gs
 import pysme.sparse_system_builder as ssb
 import pysme.system_builder as sb
 import pysme.grid_conv as gc
 import pysme.integrate as integrate
+import pysme.sde as sde
 import pysme.matrix_form as mf
 import pysme.hierarchy as hier
 
 import numpy as np
+import numba
+from numba import cuda, njit
+from scipy.integrate import odeint
 import itertools as it
 import sparse
 from sparse import COO
@@ -224,6 +230,22 @@ def test_double_increments():
                             new_dW_from_U(new_U1s[n], new_dt), 7)
         assert_almost_equal(new_dZ_from_dZ(dZs[2*n], dZs[2*n+1], dWs[2*n], dt),
                             new_dZ_from_U(new_U1s[n], new_U2s[n], new_dt), 7)
+    out = (np.empty(steps//2), np.empty(steps//2))
+    _, out_U1s, out_U2s = gc.double_increments(times, U1s, U2s, out=out)
+    assert_true(out_U1s is out[0] and out_U2s is out[1])
+    assert_almost_equal(np.max(np.abs(out_U1s - new_U1s)), 0, 7)
+    assert_almost_equal(np.max(np.abs(out_U2s - new_U2s)), 0, 7)
+
+    # Both coarser grids built in one pass should match doubling twice
+    times = np.linspace(0, 2*steps*dt, 2*steps + 1)
+    U1s = np.random.randn(3, 2*steps)
+    U2s = np.random.randn(3, 2*steps)
+    times_2, U1s_2, U2s_2 = gc.double_increments(times, U1s, U2s)
+    times_4, U1s_4, U2s_4 = gc.double_increments(times_2, U1s_2, U2s_2)
+    quadrupled = gc.quadruple_increments(times, U1s, U2s)
+    for doubled_twice, single_pass in zip([times_2, U1s_2, U2s_2, times_4,
+                                           U1s_4, U2s_4], quadrupled):
+        assert_almost_equal(np.max(np.abs(doubled_twice - single_pass)), 0, 7)
 
 def check_convergence_rate(expected_rate, integrator, rho_0, times, U1s_arr,
                            U2s_arr):
@@ -273,6 +295,308 @@ def test_convergence():
     check_convergence_rate(1.5, taylor_1_5_integrator, rho_0, times, U1s_arr,
                            U2s_arr)
 
+def qubit_system():
+    r'''Return the coupling operator, squeezing, mean photon number,
+    Hamiltonian, and initial state of a driven qubit decaying into vacuum.
+
+    '''
+    X = np.array([[0. + 0.j, 1. + 0.j], [1. + 0.j, 0. + 0.j]])
+    Y = np.array([[0. + 0.j, 0. - 1.j], [0. + 1.j, 0. + 0.j]])
+    Id = np.array([[1. + 0.j, 0. + 0.j], [0. + 0.j, 1. + 0.j]])
+    return (X - 1.j*Y)/2, 0, 0, X, (Id + X)/2
+
+def qutrit_system():
+    r'''Return the coupling operator, squeezing, mean photon number,
+    Hamiltonian, and initial state of a driven three-level system coupled to
+    a squeezed thermal bath, so that `G`, `QG`, and `GQ` are all non-trivial.
+
+    '''
+    L = np.diag([1., np.sqrt(2)], 1).astype(np.complex128)
+    H = np.array([[0.5 + 0.j, 1. + 0.j, 0. + 0.5j],
+                  [1. + 0.j, 0. + 0.j, 1. - 0.5j],
+                  [0. - 0.5j, 1. + 0.5j, -0.5 + 0.j]])
+    psi = np.array([1. + 0.j, 1. + 0.j, 0. + 1.j])/np.sqrt(3)
+    return L, 0.1 + 0.15j, 0.3, H, np.outer(psi, psi.conj())
+
+def test_fused_integrators():
+    r'''Compare the fused Euler, Milstein, and Taylor 1.5 steps to the generic
+    integrators in `sde` driven by the individual term functions.
+
+    '''
+    times = np.linspace(0, 1, 65)
+    increments = len(times) - 1
+    np.random.seed(3141592)
+    U1s = np.random.randn(increments)
+    U2s = np.random.randn(increments)
+
+    for L, M_sq, N, H, rho_0 in [qubit_system(), qutrit_system()]:
+        euler_integrator = integrate.EulerHomodyneIntegrator(L, M_sq, N, H)
+        rho_0_vec = sb.vectorize(rho_0, euler_integrator.basis).real
+        fused_rhos = euler_integrator.integrate(rho_0, times, U1s).vec_soln
+        ref_rhos = sde.euler(euler_integrator.a_fn, euler_integrator.b_fn,
+                             rho_0_vec, times, U1s)
+        assert_almost_equal(np.max(np.abs(fused_rhos - ref_rhos)), 0, 7)
+
+        mi = integrate.MilsteinHomodyneIntegrator(L, M_sq, N, H)
+        fused_rhos = mi.integrate(rho_0, times, U1s).vec_soln
+        ref_rhos = sde.milstein(mi.a_fn, mi.b_fn, mi.b_dx_b_fn, rho_0_vec,
+                                times, U1s)
+        assert_almost_equal(np.max(np.abs(fused_rhos - ref_rhos)), 0, 7)
+
+        row_k_T_integrator = integrate.MilsteinHomodyneIntegrator(
+                L, M_sq, N, H, diffusion_reps={'G': mi.G,
+                                               'k_T': mi.k_T[None,:]})
+        assert_equal(row_k_T_integrator.k_T.shape, mi.k_T.shape)
+        row_k_T_rhos = row_k_T_integrator.integrate(rho_0, times,
+                                                    U1s).vec_soln
+        assert_almost_equal(np.max(np.abs(row_k_T_rhos - fused_rhos)), 0, 7)
+
+        ti = integrate.Taylor_1_5_HomodyneIntegrator(L, M_sq, N, H)
+        fused_rhos = ti.integrate(rho_0, times, U1s, U2s).vec_soln
+        ref_rhos = sde.time_ind_taylor_1_5(ti.a_fn, ti.b_fn, ti.b_dx_b_fn,
+                                           ti.b_dx_a_fn, ti.a_dx_b_fn,
+                                           ti.a_dx_a_fn, ti.b_dx_b_dx_b_fn,
+                                           ti.b_b_dx_dx_b_fn,
+                                           ti.b_b_dx_dx_a_fn, rho_0_vec, times,
+                                           U1s, U2s)
+        assert_almost_equal(np.max(np.abs(fused_rhos - ref_rhos)), 0, 7)
+
+def test_batch_integrators():
+    r'''Make sure integrating a batch of trajectories together agrees with
+    integrating them one at a time, on even and uneven time grids.
+
+    '''
+    trajectories = 3
+    np.random.seed(1414213)
+    U1s_arr = np.random.randn(trajectories, 32)
+    U2s_arr = np.random.randn(trajectories, 32)
+
+    for L, M_sq, N, H, rho_0 in [qubit_system(), qutrit_system()]:
+        for times in [np.linspace(0, 1, 33), np.linspace(0, 1, 33)**2]:
+            for IntClass in [integrate.EulerHomodyneIntegrator,
+                             integrate.MilsteinHomodyneIntegrator,
+                             integrate.Taylor_1_5_HomodyneIntegrator]:
+                integrator = IntClass(L, M_sq, N, H)
+                soln = integrator.integrate(rho_0, times, U1s_arr, U2s_arr)
+                assert_equal(soln.vec_soln.shape,
+                             (trajectories, len(times), rho_0.size))
+                for rhos, U1s, U2s in zip(soln.vec_soln, U1s_arr, U2s_arr):
+                    ref_rhos = integrator.integrate(rho_0, times, U1s,
+                                                    U2s).vec_soln
+                    assert_almost_equal(np.max(np.abs(rhos - ref_rhos)), 0, 7)
+
+def test_calc_error():
+    r'''Make sure the Richardson error estimate is comparable to the error
+    measured against a much finer grid.
+
+    '''
+    trajectories = 16
+    times = np.linspace(0, 1, 2**10 + 1)
+    np.random.seed(6931471)
+    U1s_arr = np.random.randn(trajectories, len(times) - 1)
+    U2s_arr = np.random.randn(trajectories, len(times) - 1)
+    coarse_times, coarse_U1s_arr, coarse_U2s_arr = times, U1s_arr, U2s_arr
+    for _ in range(4):
+        coarse_times, coarse_U1s_arr, coarse_U2s_arr = gc.double_increments(
+                coarse_times, coarse_U1s_arr, coarse_U2s_arr)
+
+    L, M_sq, N, H, rho_0 = qubit_system()
+
+    for integrator in [integrate.MilsteinHomodyneIntegrator(L, M_sq, N, H),
+                       integrate.Taylor_1_5_HomodyneIntegrator(L, M_sq, N, H)]:
+        ref_rhos = integrator.integrate(rho_0, times, U1s_arr,
+                                        U2s_arr).vec_soln[:,-1]
+        coarse_rhos = integrator.integrate(rho_0, coarse_times, coarse_U1s_arr,
+                                           coarse_U2s_arr).vec_soln[:,-1]
+        error = np.mean(gc.l1_norms(coarse_rhos - ref_rhos))
+        est_error = np.mean(gc.calc_error(integrator, rho_0, coarse_times,
+                                          coarse_U1s_arr, coarse_U2s_arr))
+        assert_true(0.5 < est_error/error < 2)
+
+def test_specialized_integrators():
+    r'''Make sure the kernels specialized to the state and step size agree
+    with the generic kernels.
+
+    '''
+    times = np.linspace(0, 1, 65)
+    increments = len(times) - 1
+    np.random.seed(5772156)
+    U1s_arr = np.random.randn(2, increments)
+    U2s_arr = np.random.randn(2, increments)
+
+    for L, M_sq, N, H, rho_0 in [qubit_system(), qutrit_system()]:
+        for IntClass in [integrate.EulerHomodyneIntegrator,
+                         integrate.MilsteinHomodyneIntegrator,
+                         integrate.Taylor_1_5_HomodyneIntegrator]:
+            integrator = IntClass(L, M_sq, N, H)
+            spec_integrator = IntClass(L, M_sq, N, H, specialize=True)
+            rhos = integrator.integrate(rho_0, times, U1s_arr[0],
+                                        U2s_arr[0]).vec_soln
+            assert_true(times[1] - times[0] in integrator.prepared)
+            spec_rhos = spec_integrator.integrate(rho_0, times, U1s_arr[0],
+                                                  U2s_arr[0]).vec_soln
+            assert_almost_equal(np.max(np.abs(spec_rhos - rhos)), 0, 7)
+            rates = gc.calc_rates(integrator, rho_0, times, U1s_arr, U2s_arr)
+            spec_rates = gc.calc_rates(spec_integrator, rho_0, times, U1s_arr,
+                                       U2s_arr)
+            assert_almost_equal(np.max(np.abs(spec_rates - rates)), 0, 7)
+
+            # The specialized kernel takes the step size at run time, so new
+            # grids reuse it rather than compiling new kernels and drivers
+            overloads = len(gc.grid_final_states.overloads)
+            for stretch in [1.1, 1.2]:
+                gc.calc_rates(spec_integrator, rho_0, stretch*times, U1s_arr,
+                              U2s_arr)
+            assert_equal(len(gc.grid_final_states.overloads), overloads)
+            assert_equal(len(spec_integrator.prepared),
+                         spec_integrator.max_prepared)
+            assert_true(spec_integrator.step_kernel() is
+                        integrate.specialized_kernel(IntClass.kernel,
+                                                     rho_0.size))
+
+def test_calc_rates():
+    r'''Make sure the parallel batch of convergence rates agrees with
+    calculating the rate for each trajectory separately.
+
+    '''
+    trajectories = 4
+    times = np.linspace(0, 1, 65)
+    increments = len(times) - 1
+    np.random.seed(2718281)
+    U1s_arr = np.random.randn(trajectories, increments)
+    U2s_arr = np.random.randn(trajectories, increments)
+
+    L, M_sq, N, H, rho_0 = qubit_system()
+
+    for integrator in [integrate.EulerHomodyneIntegrator(L, M_sq, N, H),
+                       integrate.MilsteinHomodyneIntegrator(L, M_sq, N, H),
+                       integrate.Taylor_1_5_HomodyneIntegrator(L, M_sq, N, H)]:
+        rates = gc.calc_rates(integrator, rho_0, times, U1s_arr, U2s_arr)
+        batch_rates = gc.calc_rate(integrator, rho_0, times, U1s_arr, U2s_arr)
+        for rate, batch_rate, U1s, U2s in zip(rates, batch_rates, U1s_arr,
+                                              U2s_arr):
+            assert_almost_equal(rate, gc.calc_rate(integrator, rho_0, times,
+                                                   U1s, U2s), 7)
+            assert_almost_equal(batch_rate, rate, 7)
+
+    assert_raises(ValueError, gc.calc_rates, integrator, rho_0, times, U1s_arr,
+                  U2s_arr, target='gpu')
+
+    # Integrators without a compiled kernel fall back to calc_rate
+    faulty_integrator = integrate.FaultyMilsteinHomodyneIntegrator(L, M_sq, N,
+                                                                   H)
+    rates = gc.calc_rates(faulty_integrator, rho_0, times, U1s_arr, U2s_arr)
+    for rate, U1s, U2s in zip(rates, U1s_arr, U2s_arr):
+        assert_almost_equal(rate, gc.calc_rate(faulty_integrator, rho_0, times,
+                                               U1s, U2s), 7)
+
+    for vecs in [U1s_arr, U1s_arr[:,::2], U1s_arr.astype(np.float32)]:
+        assert_almost_equal(np.max(np.abs(gc.l1_norms(vecs) -
+                                          np.sum(np.abs(vecs), axis=-1))),
+                            0, 4)
+
+def check_single_precision(kernel, *args):
+    kernel(*args)
+    signature = tuple(numba.typeof(arg) for arg in args)
+    typemap = kernel.overloads[signature].type_annotation.typemap
+    assert_true(numba.float64 not in typemap.values())
+
+def test_float32_integrators():
+    r'''Make sure single-precision integration tracks double precision and
+    gives the same convergence rate.
+
+    '''
+    times = np.linspace(0, 1, 65)
+    increments = len(times) - 1
+    np.random.seed(1618033)
+    U1s = np.random.randn(increments)
+    U2s = np.random.randn(increments)
+
+    L, M_sq, N, H, rho_0 = qubit_system()
+
+    for IntClass in [integrate.EulerHomodyneIntegrator,
+                     integrate.MilsteinHomodyneIntegrator,
+                     integrate.Taylor_1_5_HomodyneIntegrator]:
+        integrator = IntClass(L, M_sq, N, H)
+        integrator_32 = IntClass(L, M_sq, N, H, dtype=np.float32)
+        rhos = integrator.integrate(rho_0, times, U1s, U2s).vec_soln
+        rhos_32 = integrator_32.integrate(rho_0, times, U1s, U2s).vec_soln
+        assert_equal(rhos_32.dtype, np.float32)
+        assert_almost_equal(np.max(np.abs(rhos_32 - rhos)), 0, 5)
+        assert_almost_equal(gc.calc_rate(integrator_32, rho_0, times, U1s,
+                                         U2s),
+                            gc.calc_rate(integrator, rho_0, times, U1s, U2s),
+                            2)
+
+    # The coefficient algebra shared with the CUDA kernels must not promote
+    # single-precision arguments to double precision
+    coeffs_fn = njit(integrate.make_taylor_1_5_coeffs(np.float32))
+    coeffs_fn(*np.ones(7, dtype=np.float32), np.empty(6, dtype=np.float32))
+    assert_equal(coeffs_fn.nopython_signatures[0].return_type, numba.float32)
+
+    # Neither may the CPU kernels, given the inputs cast by kernel_inputs
+    dt = times[1] - times[0]
+    batch_kernels = {
+            integrate.EulerHomodyneIntegrator: integrate.euler_homodyne_batch,
+            integrate.MilsteinHomodyneIntegrator:
+            integrate.milstein_homodyne_batch,
+            integrate.Taylor_1_5_HomodyneIntegrator:
+            integrate.taylor_1_5_homodyne_batch}
+    for IntClass, batch_kernel in batch_kernels.items():
+        integrator_32 = IntClass(L, M_sq, N, H, dtype=np.float32,
+                                 specialize=True)
+        rho_0_vec = sb.vectorize(rho_0, integrator_32.basis).real
+        ops = integrator_32.prepare(dt)
+        args = integrator_32.kernel_inputs(rho_0_vec, dt, U1s, U2s)
+        batch_args = integrator_32.kernel_inputs(rho_0_vec, dt, U1s[None,:],
+                                                 U2s[None,:])
+        check_single_precision(njit(IntClass.kernel.py_func), ops, *args)
+        check_single_precision(njit(batch_kernel.py_func), ops, *batch_args)
+        check_single_precision(integrator_32.step_kernel(), ops, *args)
+
+def test_uncond_integrator():
+    r'''Compare the matrix-exponential solution of the unconditional master
+    equation on even and uneven time grids to `odeint`.
+
+    '''
+    L, _, _, H, rho_0 = qubit_system()
+
+    integrator = integrate.UncondGaussIntegrator(L, 0.1, 0.2, H)
+    rho_0_vec = sb.vectorize(rho_0, integrator.basis).real
+    for times in [np.linspace(0, 2, 33), np.linspace(0, 2, 33)**2/2]:
+        ref_rhos = odeint(integrator.a_fn, rho_0_vec, times,
+                          Dfun=integrator.Dfun, rtol=1e-10, atol=1e-10)
+        rhos = integrator.integrate(rho_0, times).vec_soln
+        assert_almost_equal(np.max(np.abs(rhos - ref_rhos)), 0, 7)
+
+    rhos = integrator.integrate(rho_0, [0.5]).vec_soln
+    assert_almost_equal(np.max(np.abs(rhos - rho_0_vec[None,:])), 0, 7)
+
+def test_cuda_calc_rates():
+    r'''Make sure the convergence rates calculated on a CUDA device agree
+    with the CPU. Skipped unless a device (or the simulator enabled by setting
+    ``NUMBA_ENABLE_CUDASIM=1``) is available.
+
+    '''
+    if not cuda.is_available():
+        raise SkipTest('No CUDA device or simulator available')
+    trajectories = 4
+    times = np.linspace(0, 1, 65)
+    increments = len(times) - 1
+    np.random.seed(2718281)
+    U1s_arr = np.random.randn(trajectories, increments)
+    U2s_arr = np.random.randn(trajectories, increments)
+
+    L, M_sq, N, H, rho_0 = qubit_system()
+
+    for integrator in [integrate.EulerHomodyneIntegrator(L, M_sq, N, H),
+                       integrate.MilsteinHomodyneIntegrator(L, M_sq, N, H),
+                       integrate.Taylor_1_5_HomodyneIntegrator(L, M_sq, N, H)]:
+        rates = gc.calc_rates(integrator, rho_0, times, U1s_arr, U2s_arr)
+        cuda_rates = gc.calc_rates(integrator, rho_0, times, U1s_arr, U2s_arr,
+                                   target='cuda')
+        assert_almost_equal(np.max(np.abs(cuda_rates - rates)), 0, 7)
+
 def check_density_matrices(solution):
     density_matrices = solution.get_density_matrices()
     non_herm = [rho - rho.conj().T for rho in density_matrices]